@@ -2,20 +2,38 @@ from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.types import CallbackQuery
 from aiogram.fsm.context import FSMContext
+from aiogram.exceptions import TelegramBadRequest
 import html
+import time
+from dataclasses import asdict
+from typing import AsyncIterable, List, Union
+from contextlib import aclosing
 from os import getenv
 import csv
 from io import StringIO
 
 from app.database import db
+from app.cache import all_caches
+from app.broadcast import BroadcastJob, broadcast_engine
+from app.student.pdf_executor import pdf_executor
 from app.logger import logger
-from app.admin.keyboards import admin_menu_keyboard, fee_check_keyboard, appeal_answer_keyboard, application_review_keyboard
+from app.admin.keyboards import admin_menu_keyboard, fee_check_keyboard, appeal_answer_keyboard, application_review_keyboard, mailing_cancel_keyboard
 from app.student.keyboards import main_menu_keyboard
-from app.admin.states import AdminAppealReply, MailingForm, AdminApplicationReview
+from app.admin.states import AdminAppealReply, MailingForm, AdminApplicationReview, MPExportForm, SegmentMailingForm
+from app.admin.mp_export import export_mp_forms, find_export_users
+from app.admin.recipients import resolve_recipients, split_tokens
+from app.admin.segments import SEGMENT_HELP, Segment, count_segment, iterate_segment, parse_segment
 
 
 router = Router(name="admin")
 
+# Как часто обновлять сообщение с прогрессом длительных операций, в секундах
+PROGRESS_INTERVAL = 2
+# Сколько найденных получателей перечислять в ответе (лимит длины сообщения)
+RECIPIENTS_PREVIEW = 30
+# Сколько последних мероприятий подсказывать при настройке сегмента
+RECENT_EVENTS = 5
+
 
 @router.message(Command("admin"))
 @router.message(F.text == "Админ панель")
@@ -162,6 +180,151 @@ async def remove_admin_handler(message: types.Message) -> None:
 
 
 
+@router.message(Command("cache_stats"))
+async def cache_stats_handler(message: types.Message) -> None:
+    if not await _user_is_admin(message.from_user.id):
+        return
+
+    caches = all_caches()
+    if not caches:
+        await message.answer("Кэши ещё не созданы.")
+        return
+
+    lines = ["🗄 <b>Состояние кэшей</b>"]
+    for cache in caches:
+        stats = cache.stats()
+        limit = f"/{stats['max_bytes'] // 1024} КБ" if stats['max_bytes'] else ""
+        lines.append(
+            f"\n<b>{html.escape(stats['name'])}</b>\n"
+            f"Записей: {stats['entries']}/{stats['max_entries']}, "
+            f"объём: {stats['bytes'] // 1024} КБ{limit}\n"
+            f"Попадания: {stats['hits']} (устаревшие: {stats['stale_hits']}), "
+            f"промахи: {stats['misses']}, hit rate: {stats['hit_rate']:.0%}\n"
+            f"Вытеснено: {stats['evictions']}, истекло: {stats['expirations']}"
+        )
+
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+
+@router.message(Command("pdf_stats"))
+async def pdf_stats_handler(message: types.Message) -> None:
+    if not await _user_is_admin(message.from_user.id):
+        return
+
+    stats = pdf_executor.stats()
+    await message.answer(
+        "📄 <b>Генерация заявлений МП</b>\n"
+        f"Процессов: {stats['workers']}, в работе и в очереди: {stats['pending']}"
+        f"/{stats['workers'] + stats['max_queue']}\n"
+        f"Сформировано: {stats['completed']}, ошибок: {stats['failed']}, "
+        f"отказов из-за перегрузки: {stats['rejected']}, повторных нажатий: {stats['deduplicated']}\n"
+        f"Ожидание в очереди: в среднем {stats['wait_avg']:.2f} с, максимум {stats['wait_max']:.2f} с\n"
+        f"Генерация: в среднем {stats['run_avg']:.2f} с, максимум {stats['run_max']:.2f} с",
+        parse_mode="HTML",
+    )
+
+
+@router.message(Command("undeliverable"))
+async def undeliverable_stats_handler(message: types.Message) -> None:
+    if not await _user_is_admin(message.from_user.id):
+        return
+
+    total = await db.fetchval("SELECT COUNT(*) FROM users")
+    by_reason = await db.fetch("""
+        SELECT undeliverable_reason, COUNT(*) AS count, MAX(undeliverable_at) AS last_at
+        FROM users
+        WHERE undeliverable_at IS NOT NULL
+        GROUP BY undeliverable_reason
+        ORDER BY count DESC
+    """)
+    recent = await db.fetchval(
+        "SELECT COUNT(*) FROM users WHERE undeliverable_at > NOW() - INTERVAL '30 days'"
+    )
+
+    pruned = sum(row['count'] for row in by_reason)
+    lines = [
+        "🚫 <b>Недоступные для рассылок</b>",
+        f"Исключено из рассылок: {pruned} из {total} пользователей",
+        f"За последние 30 дней: {recent}",
+    ]
+    reasons = {
+        "blocked": "Заблокировали бота",
+        "deactivated": "Аккаунт удалён",
+        "chat_not_found": "Чат не найден",
+        "forbidden": "Запрещено Telegram",
+    }
+    for row in by_reason:
+        reason = reasons.get(row['undeliverable_reason'], row['undeliverable_reason'] or "—")
+        lines.append(f"• {html.escape(reason)}: {row['count']} (последний: {row['last_at'].strftime('%d.%m.%Y')})")
+    lines.append("\nПользователь возвращается в рассылки, когда снова отправит боту /start.")
+
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+
+@router.message(Command("mp_export"))
+async def start_mp_export(message: types.Message, state: FSMContext) -> None:
+    if not await _user_is_admin(message.from_user.id):
+        return
+
+    await message.answer(
+        "📄 <b>Выгрузка заявлений на МП</b>\n\n"
+        "Отправьте, для кого сформировать заявления:\n"
+        "• Номер группы (ИУ5-11Б) — вся группа\n"
+        "• Telegram ID (число)\n"
+        "• Бауманский логин (ivanov_ii)\n"
+        "• Номер студенческого (23У123)\n\n"
+        "Каждое значение с новой строки или через пробел. "
+        "Галочки категорий в заявлениях не проставляются.",
+        parse_mode="HTML",
+    )
+    await state.set_state(MPExportForm.users)
+
+
+@router.message(MPExportForm.users)
+async def process_mp_export(message: types.Message, state: FSMContext) -> None:
+    tokens = split_tokens(message.text)
+    if not tokens:
+        await message.answer("Список пуст. Попробуйте снова.")
+        return
+
+    users = await find_export_users(tokens)
+    if not users:
+        await message.answer("❌ Ни одного пользователя не найдено. Проверьте данные и попробуйте снова.")
+        return
+
+    await state.clear()
+    status = await message.answer(f"⏳ Формирую заявления: 0/{len(users)}")
+    last_edit = time.monotonic()
+
+    async def on_progress(done: int, total: int) -> None:
+        nonlocal last_edit
+        if done < total and time.monotonic() - last_edit < PROGRESS_INTERVAL:
+            return
+        last_edit = time.monotonic()
+        try:
+            await status.edit_text(f"⏳ Формирую заявления: {done}/{total}")
+        except TelegramBadRequest:
+            pass
+
+    parts = 0
+    try:
+        async with aclosing(export_mp_forms(users, on_progress)) as archives:
+            async for path in archives:
+                parts += 1
+                try:
+                    await message.answer_document(
+                        types.FSInputFile(path, filename=f"Заявления_МП_{parts}.zip")
+                    )
+                finally:
+                    path.unlink(missing_ok=True)
+    except Exception as e:
+        logger.error(f"Ошибка выгрузки заявлений МП: {e}")
+        await message.answer("Ошибка формирования заявлений.")
+        return
+
+    await message.answer(f"✅ Готово: заявлений {len(users)}, архивов {parts}.")
+
+
 @router.message(F.text == "Отчеты")
 async def reports_handler(message: types.Message) -> None:
     if not await _user_is_admin(message.from_user.id):
@@ -766,61 +929,26 @@ async def process_recipients(message: types.Message, state: FSMContext):
         await message.answer("Пожалуйста, отправьте текстовый список.")
         return
 
-    import re
-    tokens = re.split(r'[\s,]+', raw_text)
-    tokens = [t.strip() for t in tokens if t.strip()]
-
+    tokens = split_tokens(raw_text)
     if not tokens:
         await message.answer("Список пуст. Попробуйте снова.")
         return
 
-    found_users = []
-    not_found = []
-
-    for token in tokens:
-        user = None
-        # Пробуем по ID
-        if token.isdigit():
-            user = await db.fetchrow("SELECT telegram_id, first_name, last_name FROM users WHERE telegram_id = $1", int(token))
-        
-        # Пробуем по Username
-        if not user:
-            clean_token = token.lstrip('@')
-            user = await db.fetchrow("SELECT telegram_id, first_name, last_name FROM users WHERE username = $1", clean_token)
-
-        # Пробуем по Бауманскому логину
-        if not user:
-            user = await db.fetchrow("SELECT telegram_id, first_name, last_name FROM users WHERE bauman_login = $1", token)
-            
-        # Пробуем по номеру студенческого
-        if not user:
-            user = await db.fetchrow("SELECT telegram_id, first_name, last_name FROM users WHERE student_number = $1", token.upper())
-
-        # Пробуем по телефону
-        if not user:
-            # Удаляем нецифровые символы
-            clean_phone = "".join(filter(str.isdigit, token))
-            if len(clean_phone) >= 10:
-                # Сравниваем последние 10 цифр для обработки +7 и 8
-                user = await db.fetchrow(
-                    "SELECT telegram_id, first_name, last_name FROM users WHERE RIGHT(regexp_replace(phone, '\\D', '', 'g'), 10) = RIGHT($1, 10)",
-                    clean_phone
-                )
-
-        if user:
-            found_users.append(user)
-        else:
-            not_found.append(token)
-
-    if not found_users:
+    resolution = await resolve_recipients(tokens)
+    if not resolution.found:
         await message.answer("❌ Ни одного пользователя не найдено. Проверьте данные и попробуйте снова.")
         return
 
-    await state.update_data(recipients=[u['telegram_id'] for u in found_users])
+    await state.update_data(recipients=resolution.telegram_ids)
     
-    msg = f"✅ Найдено пользователей: {len(found_users)}\n"
-    if not_found:
-        msg += f"⚠️ Не найдено: {', '.join(not_found)}\n"
+    msg = f"✅ Найдено пользователей: {len(resolution.found)}\n"
+    for match in resolution.found[:RECIPIENTS_PREVIEW]:
+        name = f"{match.user['last_name'] or ''} {match.user['first_name'] or ''}".strip() or match.user['telegram_id']
+        msg += f"• {name} — {match.label}: {match.token}\n"
+    if len(resolution.found) > RECIPIENTS_PREVIEW:
+        msg += f"… и ещё {len(resolution.found) - RECIPIENTS_PREVIEW}\n"
+    if resolution.not_found:
+        msg += f"⚠️ Не найдено: {', '.join(resolution.not_found)}\n"
     
     msg += "\nТеперь отправьте сообщение (текст, фото), которое нужно разослать."
     
@@ -838,24 +966,147 @@ async def process_mailing_message(message: types.Message, state: FSMContext):
         await state.clear()
         return
 
-    # Отправляем всем
-    success_count = 0
-    fail_count = 0
-    
-    await message.answer("⏳ Начинаю рассылку...")
-    
-    for chat_id in recipients:
+    await state.clear()
+    await _start_mailing(
+        message,
+        recipients,
+        name=f"Индивидуальная рассылка от {message.from_user.id}",
+    )
+
+
+@router.message(F.text == "Рассылка по сегменту")
+async def start_segment_mailing(message: types.Message, state: FSMContext):
+    if not await _user_is_admin(message.from_user.id):
+        return
+
+    events = await db.fetch("SELECT id, title FROM events ORDER BY created_at DESC LIMIT $1", RECENT_EVENTS)
+    text = f"🎯 <b>Рассылка по сегменту</b>\n\n{html.escape(SEGMENT_HELP)}"
+    if events:
+        text += "\n\nПоследние мероприятия:\n" + "\n".join(
+            f"• {event['id']} — {html.escape(event['title'] or '')}" for event in events
+        )
+    await message.answer(text, parse_mode="HTML", reply_markup=types.ReplyKeyboardRemove())
+    await state.set_state(SegmentMailingForm.filters)
+
+
+@router.message(SegmentMailingForm.filters)
+async def process_segment_filters(message: types.Message, state: FSMContext):
+    try:
+        segment = parse_segment(message.text)
+    except ValueError as e:
+        await message.answer(f"❌ {e}. Попробуйте снова.")
+        return
+
+    total = await count_segment(segment)
+    if not total:
+        await message.answer("❌ Под эти условия не подходит ни один пользователь. Измените фильтры.")
+        return
+
+    await state.update_data(segment=asdict(segment))
+    await message.answer(
+        f"✅ Сегмент: {segment.describe()}\n"
+        f"Получателей: {total}\n\n"
+        "Теперь отправьте сообщение (текст, фото), которое нужно разослать."
+    )
+    await state.set_state(SegmentMailingForm.message)
+
+
+@router.message(SegmentMailingForm.message)
+async def process_segment_message(message: types.Message, state: FSMContext):
+    data = await state.get_data()
+    await state.clear()
+    if not data.get("segment"):
+        await message.answer("Сегмент не задан. Начните заново.", reply_markup=admin_menu_keyboard())
+        return
+
+    # Хранилище FSM сериализует кортежи в списки
+    segment = Segment(**{
+        key: tuple(value) if isinstance(value, list) else value
+        for key, value in data["segment"].items()
+    })
+    # Получатели читаются из БД курсором прямо в очередь рассылки
+    await _start_mailing(
+        message,
+        iterate_segment(segment),
+        name=f"Рассылка по сегменту ({segment.describe()}) от {message.from_user.id}",
+    )
+
+
+async def _start_mailing(
+    message: types.Message,
+    recipients: Union[List[int], AsyncIterable[int]],
+    name: str,
+) -> None:
+    """Поставить копию message в очередь рассылки и показывать прогресс с кнопкой отмены"""
+    status = await message.answer("⏳ Ставлю рассылку в очередь...")
+
+    async def report(job: BroadcastJob) -> None:
+        finished = job.remaining <= 0
         try:
-            await message.send_copy(chat_id=chat_id)
-            success_count += 1
-        except Exception as e:
-            logger.error(f"Failed to send message to {chat_id}: {e}")
-            fail_count += 1
-            
+            await status.edit_text(
+                _mailing_progress_text(job),
+                reply_markup=None if finished else mailing_cancel_keyboard(job.id),
+            )
+        except TelegramBadRequest:
+            pass
+
+    # Рассылка идёт в фоне: админ может пользоваться ботом, прогресс обновляется
+    # в сообщении status. После перезапуска бота рассылка продолжится без отчёта
+    enqueue = broadcast_engine.enqueue if isinstance(recipients, list) else broadcast_engine.enqueue_stream
+    job = await enqueue(
+        from_chat_id=message.chat.id,
+        message_id=message.message_id,
+        recipients=recipients,
+        name=name,
+        on_progress=report,
+    )
+    # Если воркеры уже всё отправили, финальный отчёт уже показан
+    if job.remaining > 0 or job.total == 0:
+        await report(job)
     await message.answer(
-        f"📢 Рассылка завершена.\n"
-        f"✅ Успешно: {success_count}\n"
-        f"❌ Ошибок: {fail_count}",
+        "Рассылка идёт в фоне, можно продолжать работу.",
         reply_markup=admin_menu_keyboard()
     )
-    await state.clear()
+
+
+@router.callback_query(F.data.startswith("mailing_cancel_"))
+async def cancel_mailing(callback: CallbackQuery) -> None:
+    if not await _user_is_admin(callback.from_user.id):
+        await callback.answer()
+        return
+
+    job_id = int(callback.data.split("_")[-1])
+    if await broadcast_engine.cancel(job_id):
+        await callback.answer("Рассылка остановлена.")
+    else:
+        await callback.answer("Рассылка уже завершена.", show_alert=True)
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes} мин {seconds} с" if minutes else f"{seconds} с"
+
+
+def _mailing_progress_text(job: BroadcastJob) -> str:
+    if job.remaining > 0:
+        header = f"⏳ Рассылка #{job.id} идёт"
+    elif job.cancelled:
+        header = f"⛔ Рассылка #{job.id} остановлена"
+    else:
+        header = f"📢 Рассылка #{job.id} завершена"
+
+    lines = [
+        header,
+        f"✅ Успешно: {job.sent}",
+        f"❌ Ошибок: {job.failed}",
+    ]
+    if job.cancelled:
+        lines.append(f"⛔ Отменено: {job.cancelled}")
+    if job.remaining > 0:
+        lines.append(f"📬 Осталось: {job.remaining} из {job.total}")
+        lines.append(f"⚡ Скорость: {job.rate:.1f} сообщ./с")
+        if job.eta is not None:
+            lines.append(f"🕒 Осталось примерно: {_format_duration(job.eta)}")
+    else:
+        lines.append(f"⚡ Средняя скорость: {job.rate:.1f} сообщ./с")
+    return "\n".join(lines)
@@ -6,7 +6,7 @@ def admin_menu_keyboard() -> ReplyKeyboardMarkup:
             [KeyboardButton(text="Проверить взносы")],
             [KeyboardButton(text="Обращения"), KeyboardButton(text="Заявления")],
             [KeyboardButton(text="Отчеты")],
-            [KeyboardButton(text="Индивидуальная рассылка")]
+            [KeyboardButton(text="Индивидуальная рассылка"), KeyboardButton(text="Рассылка по сегменту")]
         ],
         resize_keyboard=True
     )
@@ -39,3 +39,12 @@ def fee_check_keyboard(payment_id: int) -> InlineKeyboardMarkup:
             ]
         ]
     )
+
+def mailing_cancel_keyboard(job_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text="⛔ Остановить рассылку", callback_data=f"mailing_cancel_{job_id}")
+            ]
+        ]
+    )
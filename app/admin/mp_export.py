@@ -0,0 +1,92 @@
+import asyncio
+import os
+import re
+import tempfile
+import zipfile
+from contextlib import aclosing
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Mapping, Optional
+
+from app.database import db
+from app.student.pdf_executor import pdf_executor
+from app.student.pdf_generator import mp_profile_from_user
+
+# Лимит Telegram на отправку файла ботом — 50 МБ; архив делится на части с запасом
+ZIP_PART_LIMIT = 45 * 1024 * 1024
+EXPORT_DIR = Path("temp")
+
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+
+async def find_export_users(tokens: List[str]) -> List[Mapping[str, Any]]:
+    """Студенты по группам, Telegram ID, бауманским логинам или номерам студенческих"""
+    return await db.fetch(
+        """
+        SELECT telegram_id, last_name, first_name, patronymic, group_name, phone, bauman_login
+        FROM users
+        WHERE group_name = ANY($1::text[])
+           OR bauman_login = ANY($1::text[])
+           OR UPPER(student_number) = ANY($2::text[])
+           OR telegram_id::text = ANY($1::text[])
+        ORDER BY group_name, last_name, first_name
+        """,
+        tokens,
+        [token.upper() for token in tokens],
+    )
+
+
+def _archive_name(user: Mapping[str, Any]) -> str:
+    parts = [user['group_name'], user['last_name'], user['first_name'], str(user['telegram_id'])]
+    name = "_".join(part for part in parts if part)
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", name) + ".pdf"
+
+
+def _open_part(part: int) -> zipfile.ZipFile:
+    fd, name = tempfile.mkstemp(dir=EXPORT_DIR, prefix=f"mp_export_{part}_", suffix=".zip")
+    os.close(fd)
+    return zipfile.ZipFile(name, "w", compression=zipfile.ZIP_DEFLATED)
+
+
+async def export_mp_forms(
+    users: List[Mapping[str, Any]],
+    on_progress: ProgressCallback,
+) -> AsyncIterator[Path]:
+    """Заявления на МП для списка студентов, упакованные в ZIP.
+
+    PDF генерируются параллельно в пуле процессов и сразу дописываются
+    во временный архив, поэтому память не зависит от размера выборки.
+    Архив отдаётся частями не больше ZIP_PART_LIMIT; удалять файл части
+    должен вызывающий.
+    """
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    archive: Optional[zipfile.ZipFile] = None
+    part = 0
+    done = 0
+
+    try:
+        async with aclosing(
+            pdf_executor.generate_batch(mp_profile_from_user(user) for user in users)
+        ) as forms:
+            async for pdf_bytes in forms:
+                if archive is not None and archive.fp.tell() + len(pdf_bytes) > ZIP_PART_LIMIT:
+                    await asyncio.to_thread(archive.close)
+                    path, archive = Path(archive.filename), None
+                    yield path
+
+                if archive is None:
+                    part += 1
+                    archive = await asyncio.to_thread(_open_part, part)
+
+                await asyncio.to_thread(archive.writestr, _archive_name(users[done]), pdf_bytes)
+                done += 1
+                await on_progress(done, len(users))
+
+        if archive is not None:
+            await asyncio.to_thread(archive.close)
+            path, archive = Path(archive.filename), None
+            yield path
+    finally:
+        # Экспорт прерван: недописанную часть удаляем
+        if archive is not None:
+            archive.close()
+            Path(archive.filename).unlink(missing_ok=True)
@@ -0,0 +1,127 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from app.database import db
+
+# Порядок проверки: если токен подходит под несколько идентификаторов,
+# побеждает первый (как в прежнем последовательном поиске)
+MATCH_ORDER = ("telegram_id", "username", "bauman_login", "student_number", "phone")
+
+MATCH_LABELS = {
+    "telegram_id": "Telegram ID",
+    "username": "тег",
+    "bauman_login": "бауманский логин",
+    "student_number": "номер студенческого",
+    "phone": "телефон",
+}
+
+# Один запрос на весь список: каждая ветка использует индекс по своему столбцу
+RESOLVE_QUERY = """
+    SELECT 'telegram_id' AS matched_by, telegram_id::text AS key, telegram_id, first_name, last_name
+    FROM users WHERE telegram_id = ANY($1::bigint[])
+    UNION ALL
+    SELECT 'username', username, telegram_id, first_name, last_name
+    FROM users WHERE username = ANY($2::text[])
+    UNION ALL
+    SELECT 'bauman_login', bauman_login, telegram_id, first_name, last_name
+    FROM users WHERE bauman_login = ANY($3::text[])
+    UNION ALL
+    SELECT 'student_number', student_number, telegram_id, first_name, last_name
+    FROM users WHERE student_number = ANY($4::text[])
+    UNION ALL
+    SELECT 'phone', phone_normalized, telegram_id, first_name, last_name
+    FROM users WHERE phone_normalized = ANY($5::text[])
+"""
+
+
+@dataclass
+class RecipientMatch:
+    user: Mapping[str, Any]
+    token: str
+    matched_by: str
+
+    @property
+    def label(self) -> str:
+        return MATCH_LABELS[self.matched_by]
+
+
+@dataclass
+class Resolution:
+    found: List[RecipientMatch] = field(default_factory=list)
+    not_found: List[str] = field(default_factory=list)
+
+    @property
+    def telegram_ids(self) -> List[int]:
+        return [match.user['telegram_id'] for match in self.found]
+
+
+def split_tokens(text: str) -> List[str]:
+    """Идентификаторы из текста: через пробелы, запятые или переводы строк"""
+    return [token for token in re.split(r'[\s,]+', text or "") if token]
+
+
+def normalize_phone(token: str) -> Optional[str]:
+    """Последние 10 цифр номера (так +7 и 8 в начале не различаются)"""
+    digits = "".join(filter(str.isdigit, token))
+    return digits[-10:] if len(digits) >= 10 else None
+
+
+def _candidate_keys(token: str) -> Dict[str, str]:
+    """Под какие идентификаторы может подойти токен и с каким значением"""
+    keys = {
+        "username": token.lstrip('@'),
+        "bauman_login": token,
+        "student_number": token.upper(),
+    }
+    # BIGINT вмещает не больше 18 цифр с запасом
+    if token.isdigit() and len(token) <= 18:
+        keys["telegram_id"] = token
+    phone = normalize_phone(token)
+    if phone:
+        keys["phone"] = phone
+    return keys
+
+
+async def resolve_recipients(tokens: List[str]) -> Resolution:
+    """Найти пользователей по списку идентификаторов одним запросом к БД.
+
+    Каждый токен пробуется как Telegram ID, тег, бауманский логин, номер
+    студенческого и телефон; для найденных запоминается, по какому
+    идентификатору они совпали. Один пользователь попадает в результат один раз.
+    """
+    candidates = [(token, _candidate_keys(token)) for token in dict.fromkeys(tokens)]
+
+    def values(kind: str) -> List[str]:
+        return list({keys[kind] for _, keys in candidates if kind in keys})
+
+    rows = await db.fetch(
+        RESOLVE_QUERY,
+        [int(value) for value in values("telegram_id")],
+        values("username"),
+        values("bauman_login"),
+        values("student_number"),
+        values("phone"),
+    )
+    index: Dict[Tuple[str, str], Mapping[str, Any]] = {}
+    for row in rows:
+        # При дублях телефона или логина берём первую запись, как fetchrow раньше
+        index.setdefault((row['matched_by'], row['key']), row)
+
+    resolution = Resolution()
+    seen = set()
+    for token, keys in candidates:
+        match = next(
+            (
+                RecipientMatch(user=index[(kind, keys[kind])], token=token, matched_by=kind)
+                for kind in MATCH_ORDER
+                if kind in keys and (kind, keys[kind]) in index
+            ),
+            None,
+        )
+        if match is None:
+            resolution.not_found.append(token)
+        elif match.user['telegram_id'] not in seen:
+            seen.add(match.user['telegram_id'])
+            resolution.found.append(match)
+    return resolution
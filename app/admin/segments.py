@@ -0,0 +1,139 @@
+import re
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+from app.database import db
+
+FEE_STATUSES = {
+    "сдан": "paid",
+    "не сдан": "unpaid",
+    "на проверке": "pending",
+}
+
+FEE_CONDITIONS = {
+    "paid": "EXISTS (SELECT 1 FROM fee_payments f WHERE f.user_id = u.id AND f.status = 'approved')",
+    "unpaid": "NOT EXISTS (SELECT 1 FROM fee_payments f WHERE f.user_id = u.id AND f.status = 'approved')",
+    "pending": (
+        "EXISTS (SELECT 1 FROM fee_payments f WHERE f.user_id = u.id AND f.status = 'pending') "
+        "AND NOT EXISTS (SELECT 1 FROM fee_payments f WHERE f.user_id = u.id AND f.status = 'approved')"
+    ),
+}
+
+SEGMENT_HELP = (
+    "Каждый фильтр с новой строки в виде «ключ: значение», "
+    "несколько значений — через запятую:\n"
+    "• факультет: ИУ\n"
+    "• кафедра: ИУ6, ИУ7\n"
+    "• группа: ИУ6-54Б\n"
+    "• курс: 1, 2\n"
+    "• взнос: сдан / не сдан / на проверке\n"
+    "• мероприятие: номер мероприятия\n\n"
+    "Фильтры объединяются через «и». Пользователи, недоступные для рассылок, "
+    "не учитываются."
+)
+
+
+@dataclass(frozen=True)
+class Segment:
+    """Аудитория рассылки: условия на users, fee_payments и applications"""
+    faculties: Tuple[str, ...] = ()
+    departments: Tuple[str, ...] = ()
+    groups: Tuple[str, ...] = ()
+    courses: Tuple[int, ...] = ()
+    fee_status: Optional[str] = None
+    event_id: Optional[int] = None
+
+    def where(self) -> Tuple[str, List[Any]]:
+        """Условие WHERE для users u и его параметры"""
+        conditions = ["u.undeliverable_at IS NULL"]
+        args: List[Any] = []
+
+        def arg(value: Any) -> str:
+            args.append(value)
+            return f"${len(args)}"
+
+        if self.faculties:
+            conditions.append(f"u.group_faculty = ANY({arg(list(self.faculties))}::text[])")
+        if self.departments:
+            conditions.append(f"u.group_department = ANY({arg(list(self.departments))}::text[])")
+        if self.groups:
+            conditions.append(f"u.group_name = ANY({arg(list(self.groups))}::text[])")
+        if self.courses:
+            conditions.append(f"u.course = ANY({arg(list(self.courses))}::smallint[])")
+        if self.fee_status:
+            conditions.append(FEE_CONDITIONS[self.fee_status])
+        if self.event_id is not None:
+            conditions.append(
+                "EXISTS (SELECT 1 FROM applications a "
+                f"WHERE a.user_id = u.id AND a.related_event_id = {arg(self.event_id)})"
+            )
+        return " AND ".join(conditions), args
+
+    def describe(self) -> str:
+        parts = []
+        if self.faculties:
+            parts.append(f"факультет {', '.join(self.faculties)}")
+        if self.departments:
+            parts.append(f"кафедра {', '.join(self.departments)}")
+        if self.groups:
+            parts.append(f"группа {', '.join(self.groups)}")
+        if self.courses:
+            parts.append(f"курс {', '.join(map(str, self.courses))}")
+        if self.fee_status:
+            label = next(label for label, code in FEE_STATUSES.items() if code == self.fee_status)
+            parts.append(f"взнос {label}")
+        if self.event_id is not None:
+            parts.append(f"мероприятие #{self.event_id}")
+        return "; ".join(parts)
+
+
+def parse_segment(text: str) -> Segment:
+    """Сегмент из строк «ключ: значение». ValueError с понятным текстом при ошибке"""
+    fields = {}
+    for line in (text or "").splitlines():
+        if not line.strip():
+            continue
+        if ":" not in line:
+            raise ValueError(f"Не понял строку «{line.strip()}»: нужен формат «ключ: значение»")
+        key, value = (part.strip() for part in line.split(":", 1))
+        values = [item.upper() for item in re.split(r'[\s,]+', value) if item]
+        key = key.lower()
+
+        if key == "факультет":
+            fields["faculties"] = tuple(values)
+        elif key == "кафедра":
+            fields["departments"] = tuple(values)
+        elif key == "группа":
+            fields["groups"] = tuple(values)
+        elif key == "курс":
+            if not all(item.isdigit() and 1 <= int(item) <= 6 for item in values):
+                raise ValueError("Курс — число от 1 до 6")
+            fields["courses"] = tuple(int(item) for item in values)
+        elif key == "взнос":
+            fee_status = FEE_STATUSES.get(" ".join(value.lower().split()))
+            if fee_status is None:
+                raise ValueError("Взнос: «сдан», «не сдан» или «на проверке»")
+            fields["fee_status"] = fee_status
+        elif key == "мероприятие":
+            if not value.isdigit():
+                raise ValueError("Мероприятие — номер из списка")
+            fields["event_id"] = int(value)
+        else:
+            raise ValueError(f"Неизвестный фильтр «{key}»")
+
+    if not fields:
+        raise ValueError("Укажите хотя бы один фильтр")
+    return Segment(**fields)
+
+
+async def count_segment(segment: Segment) -> int:
+    """Размер аудитории для предпросмотра"""
+    where, args = segment.where()
+    return await db.fetchval(f"SELECT COUNT(*) FROM users u WHERE {where}", *args)
+
+
+async def iterate_segment(segment: Segment) -> AsyncIterator[int]:
+    """Telegram ID аудитории через серверный курсор, без загрузки всего списка"""
+    where, args = segment.where()
+    async for row in db.iterate(f"SELECT u.telegram_id FROM users u WHERE {where}", *args):
+        yield row['telegram_id']
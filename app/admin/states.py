@@ -11,5 +11,14 @@ class MailingForm(StatesGroup):
     confirm = State()
 
 
+class SegmentMailingForm(StatesGroup):
+    filters = State()
+    message = State()
+
+
 class AdminApplicationReview(StatesGroup):
     reason = State()
+
+
+class MPExportForm(StatesGroup):
+    users = State()
@@ -0,0 +1,457 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from os import getenv
+from typing import AsyncIterable, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from app.database import db
+from app.logger import logger
+
+# Telegram допускает около 30 сообщений в секунду разным пользователям; берём с запасом
+MESSAGES_PER_SECOND = float(getenv("BROADCAST_RATE") or 25)
+CONCURRENCY = int(getenv("BROADCAST_CONCURRENCY") or 10)
+MAX_ATTEMPTS = 3
+PROGRESS_INTERVAL = 5
+# Сколько получателей записывать в БД за раз при потоковой постановке в очередь
+ENQUEUE_BATCH = 1000
+# Как часто простаивающие воркеры проверяют очередь в БД без сигнала от enqueue
+POLL_INTERVAL = 5
+
+ProgressCallback = Callable[["BroadcastJob"], Awaitable[None]]
+
+# Задания вместе со счётчиками доставок
+JOBS_QUERY = """
+    SELECT j.id, j.name, j.from_chat_id, j.message_id,
+           COUNT(d.chat_id) AS total,
+           COUNT(d.chat_id) FILTER (WHERE d.status = 'sent') AS sent,
+           COUNT(d.chat_id) FILTER (WHERE d.status IN ('failed', 'blocked')) AS failed,
+           COUNT(d.chat_id) FILTER (WHERE d.status = 'cancelled') AS cancelled
+    FROM broadcast_jobs j
+    LEFT JOIN broadcast_deliveries d ON d.job_id = j.id
+    WHERE {condition}
+    GROUP BY j.id
+"""
+
+# Доставки для порции получателей, кроме недоступных; возвращает число записанных
+INSERT_DELIVERIES_QUERY = """
+    WITH inserted AS (
+        INSERT INTO broadcast_deliveries (job_id, chat_id)
+        SELECT $1, r.chat_id
+        FROM unnest($2::bigint[]) AS r(chat_id)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM users u
+            WHERE u.telegram_id = r.chat_id AND u.undeliverable_at IS NOT NULL
+        )
+        ON CONFLICT DO NOTHING
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM inserted
+"""
+
+# Взять одну доставку из очереди. SKIP LOCKED: одну строку не возьмут два воркера
+CLAIM_QUERY = """
+    UPDATE broadcast_deliveries d
+    SET status = 'sending', updated_at = NOW()
+    FROM (
+        SELECT q.job_id, q.chat_id
+        FROM broadcast_deliveries q
+        JOIN broadcast_jobs j ON j.id = q.job_id
+        WHERE q.status = 'queued' AND j.status = 'active'
+        ORDER BY q.job_id
+        LIMIT 1
+        FOR UPDATE OF q SKIP LOCKED
+    ) claimed
+    WHERE d.job_id = claimed.job_id AND d.chat_id = claimed.chat_id
+    RETURNING d.job_id, d.chat_id
+"""
+
+
+def undeliverable_reason(exc: Exception) -> Optional[str]:
+    """Причина, по которой пользователю больше нельзя писать, или None для временных ошибок"""
+    text = str(exc).lower()
+    if isinstance(exc, TelegramForbiddenError):
+        if "blocked" in text:
+            return "blocked"
+        if "deactivated" in text:
+            return "deactivated"
+        return "forbidden"
+    if isinstance(exc, TelegramBadRequest) and "chat not found" in text:
+        return "chat_not_found"
+    return None
+
+
+class RateLimiter:
+    """Общий для всех воркеров бюджет: не больше `rate` отправок в секунду"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next = 0.0
+
+    async def acquire(self) -> None:
+        now = time.monotonic()
+        wait = self._next - now
+        self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Приостановить все отправки (ответ Telegram RetryAfter)"""
+        self._next = max(self._next, time.monotonic() + seconds)
+
+
+@dataclass
+class BroadcastJob:
+    """Рассылка одного сообщения списку получателей"""
+    id: int
+    name: str
+    from_chat_id: int
+    message_id: int
+    total: int
+    on_progress: Optional[ProgressCallback] = None
+    sent: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+    _last_report: float = 0.0
+
+    @property
+    def remaining(self) -> int:
+        return self.total - self.sent - self.failed - self.cancelled
+
+    @property
+    def rate(self) -> float:
+        """Сообщений в секунду с начала рассылки"""
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return (self.sent + self.failed) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Оценка оставшегося времени в секундах"""
+        return self.remaining / self.rate if self.rate else None
+
+
+class BroadcastEngine:
+    """Очередь рассылок в Postgres с ограничением скорости.
+
+    `enqueue` записывает задание и доставки (status='queued') в БД и сразу
+    возвращается. Воркеры берут доставки по одной через FOR UPDATE SKIP LOCKED,
+    помечают их 'sending', отправляют в общем бюджете `rate` сообщений в секунду
+    и записывают итог: sent, failed или blocked. Получатель, заблокировавший
+    бота, удалённый или с несуществующим чатом, отмечается в users как
+    недоступный и в следующие рассылки не попадает. На RetryAfter все воркеры ждут
+    указанное время; сетевые ошибки и 5xx повторяются до MAX_ATTEMPTS раз.
+    `cancel` останавливает рассылку: оставшиеся доставки получают 'cancelled'.
+
+    После перезапуска незавершённые задания продолжаются с оставшихся
+    получателей. Доставки, застрявшие в 'sending', считаются failed: было ли
+    сообщение отправлено, неизвестно, а повторная отправка хуже пропуска.
+    """
+
+    def __init__(self, rate: float = MESSAGES_PER_SECOND, concurrency: int = CONCURRENCY):
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate)
+        self.jobs: Dict[int, BroadcastJob] = {}
+        self._wakeup = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+        self._bot: Optional[Bot] = None
+
+    async def start(self, bot: Bot) -> None:
+        """Продолжить незавершённые задания и запустить воркеры"""
+        self._bot = bot
+        await self._resume()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def enqueue(
+        self,
+        from_chat_id: int,
+        message_id: int,
+        recipients: Iterable[int],
+        name: str,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> BroadcastJob:
+        """Поставить рассылку копии сообщения в очередь. Пользователи,
+        отмеченные недоступными, в рассылку не попадают"""
+        recipients = list(dict.fromkeys(recipients))
+        # Одним запросом: задание и доставки появляются атомарно
+        row = await db.fetchrow(
+            """
+            WITH job AS (
+                INSERT INTO broadcast_jobs (name, from_chat_id, message_id)
+                VALUES ($1, $2, $3)
+                RETURNING id
+            ), deliveries AS (
+                INSERT INTO broadcast_deliveries (job_id, chat_id)
+                SELECT job.id, r.chat_id
+                FROM job, unnest($4::bigint[]) AS r(chat_id)
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM users u
+                    WHERE u.telegram_id = r.chat_id AND u.undeliverable_at IS NOT NULL
+                )
+                RETURNING chat_id
+            )
+            SELECT (SELECT id FROM job) AS id, (SELECT COUNT(*) FROM deliveries) AS total
+            """,
+            name, from_chat_id, message_id, recipients,
+        )
+        return await self._register(row['id'], name, from_chat_id, message_id, row['total'], len(recipients), on_progress)
+
+    async def enqueue_stream(
+        self,
+        from_chat_id: int,
+        message_id: int,
+        recipients: AsyncIterable[int],
+        name: str,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> BroadcastJob:
+        """Как enqueue, но получатели читаются потоком (например, из серверного
+        курсора) и записываются порциями по ENQUEUE_BATCH. Пока идёт запись,
+        задание в статусе 'preparing' и воркеры его не берут"""
+        job_id = await db.fetchval(
+            "INSERT INTO broadcast_jobs (name, from_chat_id, message_id, status) "
+            "VALUES ($1, $2, $3, 'preparing') RETURNING id",
+            name, from_chat_id, message_id,
+        )
+
+        total = 0
+        requested = 0
+        batch: List[int] = []
+        try:
+            async for chat_id in recipients:
+                batch.append(chat_id)
+                if len(batch) >= ENQUEUE_BATCH:
+                    total += await db.fetchval(INSERT_DELIVERIES_QUERY, job_id, batch)
+                    requested += len(batch)
+                    batch = []
+            if batch:
+                total += await db.fetchval(INSERT_DELIVERIES_QUERY, job_id, batch)
+                requested += len(batch)
+        except BaseException:
+            await db.execute(
+                "UPDATE broadcast_jobs SET status = 'cancelled', finished_at = NOW() WHERE id = $1", job_id
+            )
+            raise
+
+        await db.execute("UPDATE broadcast_jobs SET status = 'active' WHERE id = $1", job_id)
+        return await self._register(job_id, name, from_chat_id, message_id, total, requested, on_progress)
+
+    async def _register(
+        self,
+        job_id: int,
+        name: str,
+        from_chat_id: int,
+        message_id: int,
+        total: int,
+        requested: int,
+        on_progress: Optional[ProgressCallback],
+    ) -> BroadcastJob:
+        # Воркер мог уже взять доставку и загрузить задание из БД
+        job = self.jobs.get(job_id)
+        if job is None:
+            job = BroadcastJob(
+                id=job_id, name=name, from_chat_id=from_chat_id, message_id=message_id, total=total
+            )
+            self.jobs[job.id] = job
+        job.on_progress = on_progress
+        logger.info(
+            f"Рассылка #{job.id} «{name}»: в очереди {job.total} получателей, "
+            f"пропущено недоступных: {requested - total}"
+        )
+
+        if total:
+            self._wakeup.set()
+        else:
+            await self._finish(job)
+        return job
+
+    async def cancel(self, job_id: int) -> bool:
+        """Остановить рассылку: ещё не взятые доставки отменяются, уже
+        отправляемые завершаются. False, если рассылка уже закончилась"""
+        # Одним запросом, чтобы воркер не взял доставку между двумя обновлениями
+        row = await db.fetchrow(
+            """
+            WITH job AS (
+                UPDATE broadcast_jobs SET status = 'cancelled'
+                WHERE id = $1 AND status = 'active'
+                RETURNING id
+            ), cancelled AS (
+                UPDATE broadcast_deliveries d SET status = 'cancelled', updated_at = NOW()
+                FROM job
+                WHERE d.job_id = job.id AND d.status = 'queued'
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM job) AS found, (SELECT COUNT(*) FROM cancelled) AS cancelled
+            """,
+            job_id,
+        )
+        if not row['found']:
+            return False
+
+        logger.info(f"Рассылка #{job_id} остановлена, отменено доставок: {row['cancelled']}")
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.cancelled += row['cancelled']
+            if job.remaining <= 0:
+                await self._report(job)
+        return True
+
+    async def _resume(self) -> None:
+        interrupted = await db.execute(
+            "UPDATE broadcast_deliveries SET status = 'failed', error = 'interrupted', updated_at = NOW() "
+            "WHERE status = 'sending'"
+        )
+        logger.info(f"Рассылки: прерванные доставки помечены как failed ({interrupted})")
+
+        # Получатели такого задания записаны не полностью: отправлять его нельзя
+        await db.execute(
+            "UPDATE broadcast_jobs SET status = 'cancelled', finished_at = NOW() WHERE status = 'preparing'"
+        )
+
+        for row in await db.fetch(JOBS_QUERY.format(condition="j.status = 'active'")):
+            job = self._job_from_row(row)
+            self.jobs[job.id] = job
+            logger.info(f"Рассылка #{job.id} «{job.name}»: продолжаю, осталось {job.remaining}")
+            if job.remaining <= 0:
+                await self._finish(job)
+
+    async def _get_job(self, job_id: int) -> BroadcastJob:
+        job = self.jobs.get(job_id)
+        if job is None:
+            job = self._job_from_row(await db.fetchrow(JOBS_QUERY.format(condition="j.id = $1"), job_id))
+            self.jobs[job.id] = job
+        return job
+
+    @staticmethod
+    def _job_from_row(row) -> BroadcastJob:
+        return BroadcastJob(
+            id=row['id'],
+            name=row['name'],
+            from_chat_id=row['from_chat_id'],
+            message_id=row['message_id'],
+            total=row['total'],
+            sent=row['sent'],
+            failed=row['failed'],
+            cancelled=row['cancelled'],
+        )
+
+    async def _worker(self) -> None:
+        while True:
+            # Бюджет берём до того, как пометить доставку 'sending', чтобы
+            # между пометкой и отправкой не было ожидания
+            await self.limiter.acquire()
+            try:
+                claimed = await db.fetchrow(CLAIM_QUERY)
+            except Exception as exc:
+                logger.error(f"Рассылки: ошибка чтения очереди: {exc}")
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._process(claimed['job_id'], claimed['chat_id'])
+            except Exception as exc:
+                logger.error(f"Рассылка #{claimed['job_id']}: ошибка воркера для {claimed['chat_id']}: {exc}")
+
+    async def _process(self, job_id: int, chat_id: int) -> None:
+        job = await self._get_job(job_id)
+        status, error = await self._deliver(job, chat_id)
+        await db.execute(
+            "UPDATE broadcast_deliveries SET status = $3, error = $4, updated_at = NOW() "
+            "WHERE job_id = $1 AND chat_id = $2",
+            job_id, chat_id, status, error,
+        )
+        if status == "blocked":
+            await db.execute(
+                "UPDATE users SET undeliverable_at = NOW(), undeliverable_reason = $2 WHERE telegram_id = $1",
+                chat_id, error,
+            )
+
+        if status == "sent":
+            job.sent += 1
+        else:
+            job.failed += 1
+        await self._report(job)
+
+    async def _deliver(self, job: BroadcastJob, chat_id: int) -> Tuple[str, Optional[str]]:
+        """Отправить копию; возвращает статус доставки и текст ошибки"""
+        attempt = 0
+        while True:
+            try:
+                await self._bot.copy_message(
+                    chat_id=chat_id, from_chat_id=job.from_chat_id, message_id=job.message_id
+                )
+                return "sent", None
+            except TelegramRetryAfter as exc:
+                logger.warning(f"Рассылка #{job.id}: RetryAfter {exc.retry_after} с")
+                self.limiter.pause(exc.retry_after)
+                await self.limiter.acquire()
+            except (TelegramForbiddenError, TelegramBadRequest) as exc:
+                reason = undeliverable_reason(exc)
+                if reason is not None:
+                    logger.info(f"Рассылка #{job.id}: пользователь {chat_id} недоступен ({reason})")
+                    return "blocked", reason
+                logger.error(f"Рассылка #{job.id}: не удалось отправить {chat_id}: {exc}")
+                return "failed", str(exc)
+            except (TelegramNetworkError, TelegramServerError) as exc:
+                attempt += 1
+                if attempt >= MAX_ATTEMPTS:
+                    logger.error(f"Рассылка #{job.id}: не удалось отправить {chat_id}: {exc}")
+                    return "failed", str(exc)
+                await asyncio.sleep(attempt)
+            except Exception as exc:
+                logger.error(f"Рассылка #{job.id}: не удалось отправить {chat_id}: {exc}")
+                return "failed", str(exc)
+
+    async def _report(self, job: BroadcastJob) -> None:
+        if job.remaining <= 0:
+            await self._finish(job)
+        elif time.monotonic() - job._last_report < PROGRESS_INTERVAL:
+            return
+
+        job._last_report = time.monotonic()
+        logger.info(
+            f"Рассылка #{job.id}: отправлено {job.sent}, ошибок {job.failed}, отменено {job.cancelled}, "
+            f"осталось {job.remaining}, {job.rate:.1f} сообщ./с"
+        )
+        if job.on_progress is not None:
+            try:
+                await job.on_progress(job)
+            except Exception as exc:
+                logger.error(f"Рассылка #{job.id}: ошибка отчёта о прогрессе: {exc}")
+
+    async def _finish(self, job: BroadcastJob) -> None:
+        job.finished_at = time.monotonic()
+        job.done.set()
+        self.jobs.pop(job.id, None)
+        await db.execute(
+            "UPDATE broadcast_jobs "
+            "SET status = CASE WHEN status = 'active' THEN 'done' ELSE status END, finished_at = NOW() "
+            "WHERE id = $1",
+            job.id,
+        )
+
+
+broadcast_engine = BroadcastEngine()
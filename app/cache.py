@@ -0,0 +1,206 @@
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.logger import logger
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_ENTRIES = 1024
+SWEEP_INTERVAL = 300
+
+# Все созданные кэши по имени — для периодической очистки и статистики в админке
+_registry: Dict[str, "CacheManager"] = {}
+
+
+def estimate_size(value: Any) -> int:
+    """Приблизительный объём объекта в памяти (с вложенными контейнерами), в байтах"""
+    seen = set()
+    stack = [value]
+    total = 0
+
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+
+        if isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, "__dict__"):
+            stack.append(vars(obj))
+
+    return total
+
+
+class CacheManager:
+    """LRU-кэш с TTL, ограничением по числу записей и объёму памяти.
+
+    С `keep_stale=True` просроченные записи не удаляются: `get` их не отдаёт,
+    но они остаются доступны через `get_stale` (stale-while-revalidate) до
+    вытеснения по LRU или до `max_stale` секунд после истечения TTL.
+    """
+
+    def __init__(
+        self,
+        ttl: int = DEFAULT_TTL,
+        keep_stale: bool = False,
+        name: Optional[str] = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: Optional[int] = None,
+        max_stale: Optional[float] = None,
+        sizeof: Callable[[Any], int] = estimate_size,
+    ):
+        self.ttl = ttl
+        self.keep_stale = keep_stale
+        self.name = name or f"cache_{id(self):x}"
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_stale = max_stale
+        self._sizeof = sizeof
+        # key -> (value, timestamp, size)
+        self._cache: "OrderedDict[Hashable, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        _registry[self.name] = self
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Получить значение из кэша если оно актуально"""
+        entry = self._cache.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, timestamp, _ = entry
+        if time.time() - timestamp > self.ttl:
+            self.misses += 1
+            if not self.keep_stale:
+                self._remove(key)
+                self.expirations += 1
+            return None
+
+        self._cache.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def get_stale(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """Получить значение и его возраст в секундах, даже если оно просрочено"""
+        entry = self._cache.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, timestamp, _ = entry
+        age = time.time() - timestamp
+        self._cache.move_to_end(key)
+        if age > self.ttl:
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return value, age
+
+    def is_fresh(self, key: Hashable) -> bool:
+        """Есть ли непросроченная запись (не влияет на статистику и порядок LRU)"""
+        entry = self._cache.get(key)
+        return entry is not None and time.time() - entry[1] <= self.ttl
+
+    def set(self, key: Hashable, value: Any, timestamp: Optional[float] = None) -> None:
+        """Сохранить значение в кэш с текущим (или указанным) временем"""
+        size = self._sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            logger.warning(f"Кэш {self.name}: запись {key!r} ({size} байт) больше лимита, не сохраняю")
+            self.invalidate(key)
+            return
+
+        if key in self._cache:
+            self._remove(key)
+        self._cache[key] = (value, time.time() if timestamp is None else timestamp, size)
+        self._bytes += size
+        self._evict_overflow()
+
+    def clear(self) -> None:
+        """Очистить весь кэш"""
+        self._cache.clear()
+        self._bytes = 0
+
+    def invalidate(self, key: Hashable) -> None:
+        """Удалить конкретный ключ из кэша"""
+        if key in self._cache:
+            self._remove(key)
+
+    def sweep(self) -> int:
+        """Удалить просроченные записи. Возвращает число удалённых"""
+        now = time.time()
+        max_age = self.ttl
+        if self.keep_stale:
+            if self.max_stale is None:
+                return 0
+            max_age = self.ttl + self.max_stale
+
+        expired = [key for key, (_, timestamp, _) in self._cache.items() if now - timestamp > max_age]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики попаданий/промахов/вытеснений и текущий размер"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "name": self.name,
+            "entries": len(self._cache),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._cache.pop(key)
+        self._bytes -= size
+
+    def _evict_overflow(self) -> None:
+        while self._cache and (
+            len(self._cache) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            key, (_, _, size) = self._cache.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+
+def all_caches() -> List[CacheManager]:
+    """Все зарегистрированные кэши приложения"""
+    return list(_registry.values())
+
+
+async def run_sweeper(interval: int = SWEEP_INTERVAL) -> None:
+    """Фоновая задача: периодически удаляет просроченные записи во всех кэшах"""
+    while True:
+        await asyncio.sleep(interval)
+        for cache in all_caches():
+            try:
+                removed = cache.sweep()
+                if removed:
+                    logger.info(f"Кэш {cache.name}: удалено просроченных записей: {removed}")
+            except Exception as exc:
+                logger.error(f"Ошибка очистки кэша {cache.name}: {exc}")
@@ -1,5 +1,7 @@
 import asyncpg
+from contextlib import asynccontextmanager
 from os import getenv
+from typing import AsyncIterator
 
 
 class Database:
@@ -35,5 +37,19 @@ class Database:
         async with self.pool.acquire() as connection:
             return await connection.fetchval(query, *args)
 
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[asyncpg.Connection]:
+        """Соединение с открытой транзакцией; фиксируется при выходе без ошибок"""
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                yield connection
+
+    async def iterate(self, query: str, *args, prefetch: int = 1000) -> AsyncIterator[asyncpg.Record]:
+        """Строки результата через серверный курсор, порциями по prefetch,
+        не загружая весь результат в память"""
+        async with self.transaction() as connection:
+            async for record in connection.cursor(query, *args, prefetch=prefetch):
+                yield record
+
 
 db = Database()
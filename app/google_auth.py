@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, FrozenSet, Iterable, Optional
+
+from google.auth.transport.requests import Request
+from google.oauth2 import service_account
+
+from app.logger import logger
+
+DRIVE_SCOPE = "https://www.googleapis.com/auth/drive.readonly"
+SHEETS_SCOPE = "https://www.googleapis.com/auth/spreadsheets.readonly"
+
+DEFAULT_CREDENTIALS_PATH = "source/creds.json"
+REFRESH_MARGIN = timedelta(minutes=5)
+
+
+class GoogleTokenProvider:
+    """Асинхронный поставщик access token сервисного аккаунта Google.
+
+    Файл ключа читается один раз. Синхронный `refresh` выполняется в потоке,
+    чтобы не блокировать event loop, и заранее — за REFRESH_MARGIN до истечения.
+    На каждый набор scopes одновременно идёт не больше одного обновления:
+    остальные вызовы ждут его результата.
+    """
+
+    def __init__(self, credentials_path: str, refresh_margin: timedelta = REFRESH_MARGIN):
+        self.credentials_path = credentials_path
+        self.refresh_margin = refresh_margin
+        self._base_credentials: Optional[service_account.Credentials] = None
+        self._credentials: Dict[FrozenSet[str], service_account.Credentials] = {}
+        self._locks: Dict[FrozenSet[str], asyncio.Lock] = {}
+        self._load_lock = asyncio.Lock()
+
+    async def get_token(self, scopes: Iterable[str]) -> str:
+        """Получить действующий токен для указанных scopes"""
+        key = frozenset(scopes)
+        creds = self._credentials.get(key)
+        if creds is not None and self._is_fresh(creds):
+            return creds.token
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Пока ждали блокировку, токен мог обновить другой вызов
+            creds = self._credentials.get(key)
+            if creds is None:
+                base = await self._load_credentials()
+                creds = base.with_scopes(sorted(key))
+                self._credentials[key] = creds
+
+            if not self._is_fresh(creds):
+                logger.info(f"Обновляю токен Google для {', '.join(sorted(key))}")
+                try:
+                    await asyncio.to_thread(creds.refresh, Request())
+                except Exception as exc:
+                    logger.error(f"Ошибка получения access token: {exc}")
+                    raise
+
+            return creds.token
+
+    async def _load_credentials(self) -> service_account.Credentials:
+        async with self._load_lock:
+            if self._base_credentials is None:
+                logger.info(f"Загружаю ключ сервисного аккаунта из {self.credentials_path}")
+                self._base_credentials = await asyncio.to_thread(
+                    service_account.Credentials.from_service_account_file,
+                    self.credentials_path,
+                )
+            return self._base_credentials
+
+    def _is_fresh(self, creds: service_account.Credentials) -> bool:
+        if not creds.token or creds.expiry is None:
+            return False
+        # google-auth хранит expiry как naive datetime в UTC
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return creds.expiry - now > self.refresh_margin
+
+
+_providers: Dict[str, GoogleTokenProvider] = {}
+
+
+def get_token_provider(credentials_path: str = DEFAULT_CREDENTIALS_PATH) -> GoogleTokenProvider:
+    """Получить общий поставщик токенов для файла ключа"""
+    provider = _providers.get(credentials_path)
+    if provider is None:
+        provider = GoogleTokenProvider(credentials_path)
+        _providers[credentials_path] = provider
+    return provider
@@ -0,0 +1,17 @@
+from typing import Any, Dict
+
+from app.http_client import http_client
+
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+DEFAULT_METADATA_FIELDS = "id,mimeType,modifiedTime,version"
+
+
+async def get_file_metadata(
+    token: str, file_id: str, fields: str = DEFAULT_METADATA_FIELDS
+) -> Dict[str, Any]:
+    """Метаданные файла Google Drive. `version` растёт при каждом изменении файла"""
+    return await http_client.get_json(
+        f"{DRIVE_FILES_URL}/{file_id}",
+        headers={"Authorization": f"Bearer {token}"},
+        params={"fields": fields, "supportsAllDrives": "true"},
+    )
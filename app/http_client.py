@@ -0,0 +1,126 @@
+import asyncio
+from typing import Any, Optional
+
+import aiohttp
+
+from app.logger import logger
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HTTPStatusError(Exception):
+    """Ответ с кодом ошибки, который не удалось исправить повторами"""
+
+    def __init__(self, status: int, url: str, text: str):
+        super().__init__(f"HTTP {status} для {url}: {text[:300]}")
+        self.status = status
+        self.url = url
+        self.text = text
+
+
+class HttpClient:
+    """Общий пул HTTP-соединений для исходящих запросов к Google API.
+
+    Одна `aiohttp.ClientSession` на всё приложение сохраняет keep-alive,
+    TLS-сессии и DNS-кэш между запросами. Жизненным циклом управляет
+    `start_bot`; при обращении до `start()` сессия создаётся лениво.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 20,
+        timeout: float = 30,
+        retries: int = 3,
+        backoff: float = 0.5,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self) -> None:
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        headers: Optional[dict] = None,
+        params: Any = None,
+        timeout: Optional[float] = None,
+        expect: str = "json",
+    ) -> Any:
+        """Выполнить запрос с повторами и вернуть тело ответа.
+
+        expect: "json", "text" или "bytes". Сетевые ошибки, таймауты и ответы
+        из RETRY_STATUSES повторяются с экспоненциальной задержкой.
+        """
+        session = await self._get_session()
+        # timeout=None в session.request отключил бы таймаут сессии, поэтому передаём его всегда
+        request_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+
+        for attempt in range(self.retries + 1):
+            is_last = attempt == self.retries
+            delay = self.backoff * 2 ** attempt
+            try:
+                async with session.request(
+                    method, url, headers=headers, params=params, timeout=request_timeout
+                ) as response:
+                    if response.status < 400:
+                        if expect == "json":
+                            return await response.json()
+                        if expect == "text":
+                            return await response.text()
+                        return await response.read()
+
+                    text = await response.text()
+                    if response.status not in RETRY_STATUSES or is_last:
+                        raise HTTPStatusError(response.status, url, text)
+
+                    retry_after = response.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        delay = max(delay, int(retry_after))
+                    logger.warning(
+                        f"HTTP {response.status} для {url}, повтор через {delay:.1f} сек"
+                    )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                if is_last:
+                    raise
+                logger.warning(f"Ошибка запроса {url}: {exc!r}, повтор через {delay:.1f} сек")
+
+            await asyncio.sleep(delay)
+
+    async def get_json(self, url: str, **kwargs) -> Any:
+        return await self.request("GET", url, expect="json", **kwargs)
+
+    async def get_bytes(self, url: str, **kwargs) -> bytes:
+        return await self.request("GET", url, expect="bytes", **kwargs)
+
+
+http_client = HttpClient()
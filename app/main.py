@@ -1,13 +1,20 @@
+import asyncio
 from os import getenv
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from app.admin import admin_router
-from app.student import student_router
+from app.student.handlers import router as student_router
 from app.news.handlers import router as news_router
 from app.logger import logger
 from app.database import db
+from app.cache import run_sweeper
+from app.broadcast import broadcast_engine
+from app.http_client import http_client
+from app.student.status_checker import get_status_checker
+from app.student.schedule import shutdown_render_pool
+from app.student.pdf_executor import pdf_executor
 
 
 load_dotenv()
@@ -28,9 +35,29 @@ dp.include_router(news_router)
 async def start_bot():
     logger.info("Подключение к базе данных...")
     await db.connect()
+    await http_client.start()
+
+    checker = await get_status_checker()
+    await checker.load_persisted()
+    await pdf_executor.start()
+    background_tasks = [
+        asyncio.create_task(checker.run_refresher()),
+        asyncio.create_task(run_sweeper()),
+    ]
+
+    await broadcast_engine.start(bot)
 
     logger.info("Starting bot...")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await broadcast_engine.stop()
+
+    await http_client.close()
+    shutdown_render_pool()
+    pdf_executor.shutdown()
 
     logger.info("Закрытие соединения с БД...")
     await db.close()
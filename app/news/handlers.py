@@ -2,6 +2,7 @@ from aiogram import Router, types, F
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 import html
 from app.database import db
+from app.broadcast import broadcast_engine
 from app.logger import logger
 
 router = Router(name="news")
@@ -223,16 +224,17 @@ async def channel_post_handler(message: types.Message) -> None:
         JOIN users u ON s.user_id = u.id
         JOIN mailing_categories c ON s.category_id = c.id
         WHERE s.is_active = TRUE AND c.code = ANY($1::text[])
+          AND u.undeliverable_at IS NULL
     """
     
     try:
         users = await db.fetch(query, matched_codes)
-        logger.info(f"Broadcasting to {len(users)} users")
-        
-        for user in users:
-            try:
-                await message.copy_to(chat_id=user['telegram_id'])
-            except Exception as e:
-                logger.error(f"Failed to forward news to {user['telegram_id']}: {e}")
+        # Отправкой занимается движок рассылок; обработчик не ждёт её окончания
+        await broadcast_engine.enqueue(
+            from_chat_id=message.chat.id,
+            message_id=message.message_id,
+            recipients=[user['telegram_id'] for user in users],
+            name=title[:50],
+        )
     except Exception as e:
         logger.error(f"Error processing channel post: {e}")
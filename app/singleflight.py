@@ -0,0 +1,35 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Объединяет одновременные вызовы с одинаковым ключом в один.
+
+    Первый вызов `do` запускает `func`, остальные с тем же ключом ждут его
+    результата (или исключения). После завершения ключ освобождается, и
+    следующий вызов снова выполнит `func`. Отмена одного ожидающего не
+    отменяет общий вызов для остальных.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(future)
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        # Помечаем исключение полученным, даже если все ожидающие отменились
+        if not future.cancelled():
+            future.exception()
@@ -1 +1,2 @@
-from .handlers import router as student_router
+# Роутер импортируется из app.student.handlers: процессы пулов импортируют
+# модули пакета (pdf_generator) и не должны при этом загружать обработчики
@@ -30,11 +30,17 @@ from app.student.keyboards import (
     material_aid_travel_keyboard,
     upload_application_types_keyboard
 )
-from app.student.schedule import schedule_convert
+from app.student.schedule import (
+    RENDER_OPTIONS,
+    get_schedule_metadata,
+    schedule_revision,
+    stream_schedule_pages
+)
+from app.student.media_cache import send_document, send_photo, send_photo_stream
 from app.logger import logger
-from app.student.pdf_generator import fill_mp_pdf, MPProfile
-from datetime import datetime
-from pathlib import Path
+from app.student.pdf_generator import mp_document_key, mp_profile_from_user
+from app.student.pdf_executor import PDFQueueFull, pdf_executor
+from typing import AsyncIterator, Set
 from app.middleware import AlbumMiddleware
 
 
@@ -42,6 +48,10 @@ load_dotenv()
 router = Router(name="student")
 router.message.middleware(AlbumMiddleware())
 
+# Пользователи, которым сейчас формируется и отправляется заявление на МП:
+# повторное нажатие «Готово» до отправки не должно прислать второй документ
+_ma_generating: Set[int] = set()
+
 
 @router.message(Command("start"))
 async def start_handler(message: types.Message, state: FSMContext) -> None:
@@ -58,6 +68,14 @@ async def start_handler(message: types.Message, state: FSMContext) -> None:
 			username, telegram_id
 		)
 
+	# Пользователь снова написал боту — возвращаем его в рассылки
+	if user:
+		await db.execute(
+			"UPDATE users SET undeliverable_at = NULL, undeliverable_reason = NULL "
+			"WHERE telegram_id = $1 AND undeliverable_at IS NOT NULL",
+			telegram_id
+		)
+
 	if user:
 		await message.answer(
 			"Привет! Выбери действие:",
@@ -256,24 +274,34 @@ async def show_profile_for_confirmation(
 @router.message(lambda msg: msg.text == "Расписание")
 async def send_schedule(message: types.Message) -> None:
 	try:
-		pages = await schedule_convert(
-			credentials_path="source/creds.json",
-			document_id=getenv("SCHEDULE_ID"),
-		)
+		document_id = getenv("SCHEDULE_ID")
+		metadata = await get_schedule_metadata("source/creds.json", document_id)
+
+		async def render_pages() -> AsyncIterator[types.BufferedInputFile]:
+			await message.answer("Ожидайте...")
+			index = 0
+			async for image_bytes in stream_schedule_pages(
+				credentials_path="source/creds.json",
+				document_id=document_id,
+				metadata=metadata,
+			):
+				index += 1
+				yield types.BufferedInputFile(
+					file=image_bytes,
+					filename=f"schedule_page_{index}.{RENDER_OPTIONS.extension}",
+				)
 
-		if not pages:
-			raise RuntimeError("Не удалось преобразовать расписание в PNG")
+			if not index:
+				raise RuntimeError("Не удалось преобразовать расписание в изображения")
 
-		await message.answer("Ожидайте...")
-		for index, image_bytes in enumerate(pages, start=1):
-			caption = "📄 Расписание дежурств" if index == 1 else None
-			await message.answer_photo(
-				photo=types.BufferedInputFile(
-					file=image_bytes,
-					filename=f"schedule_page_{index}.png",
-				),
-				caption=caption,
-			)
+		# Страницы уходят по мере рендеринга; уже загруженные страницы
+		# этой ревизии отправляются альбомом по file_id
+		await send_photo_stream(
+			message,
+			key=("schedule", document_id, schedule_revision(metadata)),
+			load_photos=render_pages,
+			caption="📄 Расписание дежурств",
+		)
 
 	except Exception as exc:
 		logger.error(f"Ошибка отправки расписания: {exc}")
@@ -283,8 +311,12 @@ async def send_schedule(message: types.Message) -> None:
 @router.message(lambda msg: msg.text == "Карта")
 async def send_map(message: types.Message) -> None:
 	try:
-		photo = types.FSInputFile("source/map.jpg")
-		await message.answer_photo(photo, caption="📍 Маршрут до профкома ИУ")
+		await send_photo(
+			message,
+			key="source/map.jpg",
+			load_photo=lambda: types.FSInputFile("source/map.jpg"),
+			caption="📍 Маршрут до профкома ИУ",
+		)
 	except Exception as exc:
 		logger.error(f"Ошибка отправки карты: {exc}")
 		await message.answer("Ошибка при загрузке карты.")
@@ -652,6 +684,20 @@ async def toggle_ma_category(callback: CallbackQuery, state: FSMContext):
 
 @router.callback_query(MaterialAidForm.categories, F.data == "ma_done")
 async def finish_ma_generation(callback: CallbackQuery, state: FSMContext):
+    telegram_id = callback.from_user.id
+    # Проверка и отметка без await между ними: второе нажатие увидит отметку
+    if telegram_id in _ma_generating:
+        await callback.answer("Заявление уже формируется, подождите...")
+        return
+
+    _ma_generating.add(telegram_id)
+    try:
+        await _send_ma_application(callback, state)
+    finally:
+        _ma_generating.discard(telegram_id)
+
+
+async def _send_ma_application(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     telegram_id = callback.from_user.id
     user = await _get_user_record(telegram_id)
@@ -660,35 +706,8 @@ async def finish_ma_generation(callback: CallbackQuery, state: FSMContext):
     categories = data.get("categories", [])
     dorm_info = data.get("dorm_info", "")
     
-    # Парсим информацию об общежитии, если она есть
-    dorm_num = ""
-    dorm_room = ""
-    if dorm_info:
-        parts = dorm_info.replace(",", " ").split()
-        if len(parts) >= 1: dorm_num = parts[0]
-        if len(parts) >= 2: dorm_room = parts[1]
-
-    fio = f"{user['last_name']} {user['first_name']}"
-    if user['patronymic']:
-        fio += f" {user['patronymic']}"
-
-    signature = user['last_name'] or ""
-    if user['first_name']:
-        signature += f" {user['first_name'][0]}."
-    if user['patronymic']:
-        signature += f"{user['patronymic'][0]}."
-
-    profile = MPProfile(
-        fio=fio,
-        group=user['group_name'] or "",
-        phone=user['phone'] or "",
-        email_local=user['bauman_login'] or "",
-        dorm_number=dorm_num,
-        dorm_room=dorm_room,
-        date=datetime.now().strftime("%d.%m.%Y"),
-        signature=signature
-    )
-    
+    profile = mp_profile_from_user(user, dorm_info)
+
     # Объединяем тип поддержки и категории
     selected_toggles = list(categories)
     if support_type:
@@ -697,22 +716,26 @@ async def finish_ma_generation(callback: CallbackQuery, state: FSMContext):
         if support_type in ["support_travel_home", "support_travel_treatment"]:
             selected_toggles.append("support_travel")
 
-    output_path = Path(f"temp/Заявление_МП_{telegram_id}.pdf")
-    
+    async def load_document() -> types.BufferedInputFile:
+        pdf_bytes = await pdf_executor.generate(telegram_id, profile, selected_toggles)
+        return types.BufferedInputFile(pdf_bytes, filename="Заявление_МП.pdf")
+
     try:
-        fill_mp_pdf(
-            input_pdf=Path("source/Заявление_МП.pdf"),
-            output_pdf=output_path,
-            profile=profile,
-            selected=selected_toggles
+        # Такое же заявление уже отправлялось — повторно уходит по file_id
+        await send_document(
+            callback.message,
+            key=("mp_application", mp_document_key(profile, selected_toggles)),
+            load_document=load_document,
+            caption="Ваше заявление сформировано.",
         )
-        
-        file = types.FSInputFile(output_path, filename="Заявление_МП.pdf")
-        await callback.message.answer_document(file, caption="Ваше заявление сформировано.")
-        
-        if output_path.exists():
-            output_path.unlink()
-            
+
+    except PDFQueueFull:
+        # Состояние не сбрасываем: пользователь может нажать «Готово» ещё раз
+        await callback.answer(
+            "Сейчас формируется много заявлений. Подождите минуту и нажмите «Готово» ещё раз.",
+            show_alert=True,
+        )
+        return
     except Exception as e:
         logger.error(f"Error generating PDF: {e}")
         await callback.message.answer("Ошибка генерации заявления.")
@@ -766,6 +789,8 @@ async def check_application_status(message: types.Message) -> None:
         mp = statuses.get('material_help', {})
         if mp.get('found'):
             text += f"🟢 <b>Материальная помощь</b>\n{mp.get('text', 'Неизвестно')}\n\n"
+        elif mp.get('status') == 'error':
+            text += f"🟢 <b>Материальная помощь</b>\n⚠️ Не удалось загрузить данные\n\n"
         else:
             text += f"🟢 <b>Материальная помощь</b>\nℹ️ Заявление не подано\n\n"
         
@@ -773,6 +798,8 @@ async def check_application_status(message: types.Message) -> None:
         kp = statuses.get('travel_compensation', {})
         if kp.get('found'):
             text += f"🟣 <b>Компенсация проезда</b>\n{kp.get('text', 'Неизвестно')}\n\n"
+        elif kp.get('status') == 'error':
+            text += f"🟣 <b>Компенсация проезда</b>\n⚠️ Не удалось загрузить данные\n\n"
         else:
             text += f"🟣 <b>Компенсация проезда</b>\nℹ️ Заявление не подано\n\n"
         
@@ -780,10 +807,18 @@ async def check_application_status(message: types.Message) -> None:
         obsh = statuses.get('housing_compensation', {})
         if obsh.get('found'):
             text += f"🟢 <b>Компенсация общежития</b>\n{obsh.get('text', 'Неизвестно')}"
+        elif obsh.get('status') == 'error':
+            text += f"🟢 <b>Компенсация общежития</b>\n⚠️ Не удалось загрузить данные"
         else:
             text += f"🟢 <b>Компенсация общежития</b>\nℹ️ Заявление не подано"
         
-        text += "\n\n💡 <i>Данные обновляются каждый час</i>"
+        ages = [status['age'] for status in statuses.values() if 'age' in status]
+        if ages:
+            minutes = int(max(ages) // 60)
+            updated = "только что" if minutes == 0 else f"{minutes} мин. назад"
+            text += f"\n\n💡 <i>Данные обновлены {updated}</i>"
+        if any(status.get('stale') for status in statuses.values()):
+            text += "\n⚠️ <i>Таблицы сейчас недоступны, показаны последние сохранённые данные</i>"
         
         await message.answer(
             text,
@@ -845,10 +880,10 @@ async def union_fee_status(message: types.Message) -> None:
 
 @router.callback_query(F.data == "pay_union_fee")
 async def start_union_fee_payment(callback: CallbackQuery, state: FSMContext) -> None:
-    qr = types.FSInputFile("source/union_fee_qr.png")
-
-    await callback.message.answer_photo(
-        photo=qr,
+    await send_photo(
+        callback.message,
+        key="source/union_fee_qr.png",
+        load_photo=lambda: types.FSInputFile("source/union_fee_qr.png"),
         caption=(
             "💳 Оплата профвзноса\n"
 			"Внесение профсоюзного взноса можно осущиствить двумя способами:\n"
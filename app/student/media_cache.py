@@ -0,0 +1,119 @@
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable, Hashable, List, Optional, Union
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest
+
+from app.cache import CacheManager
+from app.logger import logger
+
+MEDIA_GROUP_LIMIT = 10
+
+PhotoSource = Union[str, types.InputFile]
+
+# file_id уже загруженных в Telegram фото: повторная отправка по file_id
+# не передаёт сам файл
+_file_ids = CacheManager(ttl=30 * 24 * 3600, name="telegram_file_ids", max_entries=256)
+# file_id отправленных документов по ключу содержимого: их много (по одному
+# на заявление), поэтому отдельно, чтобы не вытеснять фото
+_document_ids = CacheManager(ttl=7 * 24 * 3600, name="telegram_document_ids", max_entries=1024)
+
+
+async def send_photo(
+    message: types.Message,
+    key: Hashable,
+    load_photo: Callable[[], types.InputFile],
+    caption: Optional[str] = None,
+    **kwargs,
+) -> None:
+    """Отправить фото; файл загружается в Telegram только в первый раз"""
+    file_id = _file_ids.get(key)
+    if file_id is not None:
+        try:
+            await message.answer_photo(file_id, caption=caption, **kwargs)
+            return
+        except TelegramBadRequest as exc:
+            logger.warning(f"file_id для {key!r} больше не действителен: {exc}")
+            _file_ids.invalidate(key)
+
+    sent = await message.answer_photo(load_photo(), caption=caption, **kwargs)
+    _file_ids.set(key, sent.photo[-1].file_id)
+
+
+async def send_document(
+    message: types.Message,
+    key: Hashable,
+    load_document: Callable[[], Awaitable[types.InputFile]],
+    caption: Optional[str] = None,
+) -> None:
+    """Отправить документ; `load_document` вызывается, только если документ
+    с таким ключом ещё не отправлялся"""
+    file_id = _document_ids.get(key)
+    if file_id is not None:
+        try:
+            await message.answer_document(file_id, caption=caption)
+            return
+        except TelegramBadRequest as exc:
+            logger.warning(f"file_id для {key!r} больше не действителен: {exc}")
+            _document_ids.invalidate(key)
+
+    sent = await message.answer_document(await load_document(), caption=caption)
+    _document_ids.set(key, sent.document.file_id)
+
+
+async def send_photo_stream(
+    message: types.Message,
+    key: Hashable,
+    load_photos: Callable[[], AsyncIterator[types.InputFile]],
+    caption: Optional[str] = None,
+) -> None:
+    """Отправить фото по мере их готовности, не дожидаясь остальных.
+    Когда file_id для `key` уже известны, фото уходят альбомом"""
+    file_ids = _file_ids.get(key)
+    if file_ids is not None:
+        try:
+            await _send_group(message, file_ids, caption)
+            return
+        except TelegramBadRequest as exc:
+            logger.warning(f"file_id для {key!r} больше не действительны: {exc}")
+            _file_ids.invalidate(key)
+
+    file_ids = []
+    async with aclosing(load_photos()) as photos:
+        async for photo in photos:
+            # Одновременный запрос мог уже загрузить все фото: остальные уходят по file_id
+            known = _file_ids.get(key)
+            if known is not None and len(known) > len(file_ids):
+                try:
+                    await _send_group(message, known[len(file_ids):], None if file_ids else caption)
+                    return
+                except TelegramBadRequest as exc:
+                    logger.warning(f"file_id для {key!r} больше не действительны: {exc}")
+                    _file_ids.invalidate(key)
+
+            sent = await message.answer_photo(photo, caption=None if file_ids else caption)
+            file_ids.append(sent.photo[-1].file_id)
+    _file_ids.set(key, file_ids)
+
+
+async def _send_group(
+    message: types.Message, photos: List[PhotoSource], caption: Optional[str]
+) -> List[str]:
+    """Отправить фото альбомами по MEDIA_GROUP_LIMIT и вернуть их file_id"""
+    file_ids: List[str] = []
+    for start in range(0, len(photos), MEDIA_GROUP_LIMIT):
+        chunk = photos[start:start + MEDIA_GROUP_LIMIT]
+        chunk_caption = caption if start == 0 else None
+
+        # Альбом должен содержать минимум два элемента
+        if len(chunk) == 1:
+            sent = [await message.answer_photo(chunk[0], caption=chunk_caption)]
+        else:
+            media = [
+                types.InputMediaPhoto(media=photo, caption=chunk_caption if index == 0 else None)
+                for index, photo in enumerate(chunk)
+            ]
+            sent = await message.answer_media_group(media)
+
+        file_ids.extend(sent_message.photo[-1].file_id for sent_message in sent)
+    return file_ids
@@ -0,0 +1,159 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from os import getenv
+from typing import Any, AsyncIterator, Deque, Dict, Hashable, Iterable, Optional, Tuple
+
+from app.cache import CacheManager
+from app.logger import logger
+from app.singleflight import SingleFlight
+from app.student.pdf_generator import MPProfile, mp_document_key
+from app.workers.mp_pdf import generate, warm_up
+
+PDF_WORKERS = int(getenv("MP_PDF_WORKERS") or min(2, os.cpu_count() or 1))
+PDF_MAX_QUEUE = int(getenv("MP_PDF_MAX_QUEUE") or 20)
+
+
+class PDFQueueFull(Exception):
+    """Очередь генерации заявлений переполнена"""
+
+
+class PDFExecutor:
+    """Генерация заявлений на МП в пуле процессов, не блокируя event loop.
+
+    В работе и в очереди одновременно не больше `workers + max_queue` заявлений:
+    сверх этого `generate` сразу бросает PDFQueueFull, чтобы при перегрузке
+    пользователь получил «подождите», а не ждал вместе со всеми. Генерации
+    объединяются и запоминаются по содержимому (`mp_document_key`): запрос такого же
+    заявления ждёт уже идущую генерацию, готовое повторно не генерируется.
+    """
+
+    def __init__(self, workers: int = PDF_WORKERS, max_queue: int = PDF_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._flights = SingleFlight()
+        self._documents = CacheManager(
+            ttl=24 * 3600,
+            name="mp_documents",
+            max_entries=64,
+            max_bytes=64 * 1024 * 1024,
+        )
+        self._pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.deduplicated = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+
+    async def start(self) -> None:
+        """Запустить процессы пула; каждый разбирает шаблон при старте"""
+        await asyncio.get_running_loop().run_in_executor(self._get_pool(), warm_up)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def generate(self, key: Hashable, profile: MPProfile, selected: Iterable[str]) -> bytes:
+        """Заполненное заявление в виде bytes"""
+        selected = tuple(selected)
+        digest = mp_document_key(profile, selected)
+        pdf_bytes = self._documents.get(digest)
+        if pdf_bytes is not None:
+            return pdf_bytes
+
+        if self._flights.in_flight(digest):
+            self.deduplicated += 1
+        elif self._pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            logger.warning(f"Очередь генерации заявлений переполнена ({self._pending}), отказ для {key!r}")
+            raise PDFQueueFull()
+
+        # Задача ставится в пул сразу (do вызывает лямбду синхронно), поэтому
+        # лимит очереди держится и при всплеске одновременных запросов
+        return await self._flights.do(digest, lambda: self._remember(digest, self._submit(profile, selected)))
+
+    async def generate_batch(self, profiles: Iterable[MPProfile]) -> AsyncIterator[bytes]:
+        """Заявления без галочек для нескольких студентов, по порядку.
+        В пуле одновременно не больше `workers` заявлений пакета: заявки студентов
+        не ждут весь пакет, а в памяти держится только это окно."""
+        profiles = iter(profiles)
+        pending: Deque[asyncio.Future] = deque()
+        try:
+            while True:
+                while len(pending) < self.workers:
+                    profile = next(profiles, None)
+                    if profile is None:
+                        break
+                    pending.append(self._submit(profile, ()))
+                if not pending:
+                    return
+                pdf_bytes, _, _ = await pending.popleft()
+                yield pdf_bytes
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _submit(self, profile: MPProfile, selected: Tuple[str, ...]) -> asyncio.Future:
+        future = asyncio.get_running_loop().run_in_executor(
+            self._get_pool(), generate, profile, selected, time.time()
+        )
+        self._pending += 1
+        future.add_done_callback(self._job_done)
+        return future
+
+    def _job_done(self, future: asyncio.Future) -> None:
+        self._pending -= 1
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.failed += 1
+            return
+
+        _, wait, duration = future.result()
+        self.completed += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.run_total += duration
+        self.run_max = max(self.run_max, duration)
+        logger.info(f"Заявление МП сформировано: ожидание {wait:.2f} с, генерация {duration:.2f} с")
+
+    async def _remember(self, digest: str, job: asyncio.Future) -> bytes:
+        pdf_bytes, _, _ = await job
+        self._documents.set(digest, pdf_bytes)
+        return pdf_bytes
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики и время ожидания/генерации для мониторинга"""
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "deduplicated": self.deduplicated,
+            "wait_avg": self.wait_total / self.completed if self.completed else 0.0,
+            "wait_max": self.wait_max,
+            "run_avg": self.run_total / self.completed if self.completed else 0.0,
+            "run_max": self.run_max,
+        }
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=warm_up,
+            )
+        return self._pool
+
+
+pdf_executor = PDFExecutor()
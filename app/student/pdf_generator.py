@@ -1,12 +1,21 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import hashlib
+import io
+import json
+from dataclasses import asdict, dataclass
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, Set, Iterable
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
 
 from pypdf import PdfReader, PdfWriter
 from pypdf.generic import NameObject, BooleanObject, DictionaryObject
 
+from app.logger import logger
+
+
+MP_TEMPLATE_PATH = Path("source/Заявление_МП.pdf")
+
 
 TEXT_FIELD_MAP: Dict[str, str] = {
 	"fio": "fill_1",
@@ -76,6 +85,44 @@ class MPProfile:
 	signature: str
 
 
+def mp_profile_from_user(user: Mapping[str, Any], dorm_info: str = "") -> MPProfile:
+	"""Данные заявления из записи users; dorm_info — «номер общежития, комната»"""
+	# Парсим информацию об общежитии, если она есть
+	dorm_num = ""
+	dorm_room = ""
+	if dorm_info:
+		parts = dorm_info.replace(",", " ").split()
+		if len(parts) >= 1: dorm_num = parts[0]
+		if len(parts) >= 2: dorm_room = parts[1]
+
+	fio = f"{user['last_name']} {user['first_name']}"
+	if user['patronymic']:
+		fio += f" {user['patronymic']}"
+
+	signature = user['last_name'] or ""
+	if user['first_name']:
+		signature += f" {user['first_name'][0]}."
+	if user['patronymic']:
+		signature += f"{user['patronymic'][0]}."
+
+	return MPProfile(
+		fio=fio,
+		group=user['group_name'] or "",
+		phone=user['phone'] or "",
+		email_local=user['bauman_login'] or "",
+		dorm_number=dorm_num,
+		dorm_room=dorm_room,
+		date=datetime.now().strftime("%d.%m.%Y"),
+		signature=signature
+	)
+
+
+def mp_document_key(profile: MPProfile, selected: Iterable[str]) -> str:
+	"""Ключ содержимого заявления: sha256 от анкеты и отсортированных галочек"""
+	payload = json.dumps([asdict(profile), sorted(set(selected))], ensure_ascii=False)
+	return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
 def _set_need_appearances(writer: PdfWriter) -> None:
 	root = writer._root_object
 	if "/AcroForm" not in root:
@@ -98,76 +145,113 @@ def _get_checkbox_on_state(annot_obj) -> NameObject:
 	return NameObject("/Yes")
 
 
-def fill_mp_pdf(
-	input_pdf: Path,
-	output_pdf: Path,
-	profile: MPProfile,
-	selected: Iterable[str],
-) -> None:
-	"""
-	selected: список семантических ключей из CHECKBOX_MAP
-	например: ["category_achievements", "support_one_time"]
+class MPTemplate:
+	"""Шаблон заявления на МП, разобранный один раз.
+
+	Все toggle_* заранее сброшены в Off, виджеты проиндексированы по имени
+	поля, состояния «включено» у галочек закэшированы. На каждый запрос
+	структура документа клонируется из уже разобранных объектов, и меняются
+	только затронутые поля.
 	"""
-	selected_keys: Set[str] = set(selected)
-
-	reader = PdfReader(str(input_pdf))
-
-	# Сначала проставляем галочки прямо в аннотациях (Widget)
-	selected_toggle_names: Set[str] = set()
-	for key in selected_keys:
-		if key not in CHECKBOX_MAP:
-			# Можно логировать или игнорировать, но лучше знать
-			print(f"Warning: Unknown checkbox key: {key}")
-			continue
-		selected_toggle_names.add(CHECKBOX_MAP[key])
-
-	for page in reader.pages:
-		annots = page.get("/Annots")
-		if not annots:
-			continue
-
-		for a in annots:
-			obj = a.get_object()
-			if obj.get("/Subtype") != "/Widget":
-				continue
 
-			name = obj.get("/T")
-			if not name:
-				continue
+	def __init__(self, path: Path):
+		self.path = path
+		self._reader = PdfReader(str(path))
+		# имя поля -> [(номер страницы, номер аннотации на странице)]
+		self._widgets: Dict[str, List[Tuple[int, int]]] = {}
+		self._on_states: Dict[str, NameObject] = {}
 
-			name_str = str(name)
+		for page_index, page in enumerate(self._reader.pages):
+			for annot_index, a in enumerate(page.get("/Annots") or []):
+				obj = a.get_object()
+				if obj.get("/Subtype") != "/Widget":
+					continue
 
-			# Все toggle_* принудительно сбрасываем в Off, чтобы не было "залипаний"
-			if name_str.startswith("toggle_"):
-				obj[NameObject("/V")] = NameObject("/Off")
-				obj[NameObject("/AS")] = NameObject("/Off")
+				name = obj.get("/T")
+				if not name:
+					continue
 
-			# Те, что выбраны — включаем
-			if name_str in selected_toggle_names:
-				on_state = _get_checkbox_on_state(obj)
+				name_str = str(name)
+				self._widgets.setdefault(name_str, []).append((page_index, annot_index))
+
+				# Все toggle_* сбрасываем в Off один раз, в самом шаблоне
+				if name_str.startswith("toggle_"):
+					self._on_states.setdefault(name_str, _get_checkbox_on_state(obj))
+					obj[NameObject("/V")] = NameObject("/Off")
+					obj[NameObject("/AS")] = NameObject("/Off")
+
+		# Пробное клонирование разбирает все объекты документа сразу, а не на первом запросе
+		PdfWriter().clone_reader_document_root(self._reader)
+
+	def render(self, profile: MPProfile, selected: Iterable[str]) -> PdfWriter:
+		"""Заполненная копия шаблона"""
+		writer = PdfWriter()
+		writer.clone_reader_document_root(self._reader)
+		_set_need_appearances(writer)
+
+		for key in set(selected):
+			if key not in CHECKBOX_MAP:
+				logger.warning(f"Неизвестный ключ галочки: {key}")
+				continue
+			toggle_name = CHECKBOX_MAP[key]
+			on_state = self._on_states.get(toggle_name, NameObject("/Yes"))
+			for obj in self._widget_objects(writer, toggle_name):
 				obj[NameObject("/V")] = on_state
 				obj[NameObject("/AS")] = on_state
 
-	# Текстовые поля
-	text_values: Dict[str, str] = {
-		TEXT_FIELD_MAP["fio"]: profile.fio,
-		TEXT_FIELD_MAP["group"]: profile.group,
-		TEXT_FIELD_MAP["phone"]: profile.phone,
-		TEXT_FIELD_MAP["email_local"]: profile.email_local,
-		TEXT_FIELD_MAP["dorm_number"]: profile.dorm_number,
-		TEXT_FIELD_MAP["dorm_room"]: profile.dorm_room,
-		TEXT_FIELD_MAP["date"]: profile.date,
-		TEXT_FIELD_MAP["signature"]: profile.signature,
-	}
+		# Текстовые поля — только на страницах, где они есть
+		text_values = {
+			field_name: getattr(profile, attr) for attr, field_name in TEXT_FIELD_MAP.items()
+		}
+		pages = sorted({
+			page_index
+			for field_name in text_values
+			for page_index, _ in self._widgets.get(field_name, [])
+		})
+		for page_index in pages:
+			writer.update_page_form_field_values(writer.pages[page_index], text_values)
+
+		return writer
+
+	def _widget_objects(self, writer: PdfWriter, name: str) -> List[DictionaryObject]:
+		return [
+			writer.pages[page_index]["/Annots"][annot_index].get_object()
+			for page_index, annot_index in self._widgets.get(name, [])
+		]
+
+
+_templates: Dict[Path, MPTemplate] = {}
+
 
-	writer = PdfWriter()
-	writer.clone_reader_document_root(reader)
+def get_mp_template(path: Path = MP_TEMPLATE_PATH) -> MPTemplate:
+	"""Общий разобранный шаблон для файла (разбирается при первом обращении)"""
+	template = _templates.get(path)
+	if template is None:
+		template = MPTemplate(path)
+		_templates[path] = template
+	return template
 
-	_set_need_appearances(writer)
 
-	for page in writer.pages:
-		writer.update_page_form_field_values(page, text_values)
+def fill_mp_pdf(
+	input_pdf: Path,
+	output_pdf: Optional[Path],
+	profile: MPProfile,
+	selected: Iterable[str],
+) -> Optional[bytes]:
+	"""
+	selected: список семантических ключей из CHECKBOX_MAP
+	например: ["category_achievements", "support_one_time"]
+
+	Без output_pdf документ собирается в памяти и возвращается как bytes.
+	"""
+	writer = get_mp_template(input_pdf).render(profile, selected)
+
+	if output_pdf is None:
+		buffer = io.BytesIO()
+		writer.write(buffer)
+		return buffer.getvalue()
 
 	output_pdf.parent.mkdir(parents=True, exist_ok=True)
 	with open(output_pdf, "wb") as f:
 		writer.write(f)
+	return None
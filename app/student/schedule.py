@@ -1,106 +1,339 @@
-import io
-from typing import List
-
-import aiohttp
-import pypdfium2 as pdfium
-from google.auth.transport.requests import Request
-from google.oauth2 import service_account
+import asyncio
+import multiprocessing
+import os
+import shutil
+from collections import deque
+from os import getenv
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set, Union
 
+from app.google_auth import DRIVE_SCOPE, get_token_provider
+from app.google_drive import get_file_metadata
+from app.http_client import HTTPStatusError, http_client
 from app.logger import logger
+from app.workers.schedule_render import count_pages, render_page
 
-DRIVE_SCOPE = "https://www.googleapis.com/auth/drive.readonly"
-METADATA_URL = "https://www.googleapis.com/drive/v3/files/{file_id}?fields=mimeType"
 EXPORT_URL = "https://www.googleapis.com/drive/v3/files/{file_id}/export?mimeType=application/pdf"
 DOWNLOAD_URL = "https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
 
+CACHE_DIR = Path("cache/schedule")
+PAGE_FILE_PATTERN = "page_{index:03d}.{extension}"
+COMPLETE_MARKER = "complete"
 
-async def schedule_convert(credentials_path: str, document_id: str) -> List[bytes]:
-    pdf_bytes = await _download_pdf(credentials_path, document_id)
-    return _pdf_to_png(pdf_bytes)
+IMAGE_FORMATS = {"PNG": "png", "WEBP": "webp", "JPEG": "jpg"}
+# os.cpu_count() в контейнере — число CPU хоста, а не квота, поэтому по умолчанию немного
+RENDER_WORKERS = int(getenv("SCHEDULE_RENDER_WORKERS") or min(2, os.cpu_count() or 1))
+# Пределы на запросы к Drive: зависший запрос не должен оставить рендер незавершённым
+METADATA_TIMEOUT = 15
+DOWNLOAD_TIMEOUT = 60
 
 
-async def _download_pdf(credentials_path: str, document_id: str) -> bytes:
-    creds = service_account.Credentials.from_service_account_file(
-        credentials_path,
-        scopes=[DRIVE_SCOPE],
-    )
-    creds.refresh(Request())
-    headers = {"Authorization": f"Bearer {creds.token}"}
+@dataclass(frozen=True)
+class RenderOptions:
+    """Параметры растеризации страниц расписания"""
+    scale: float = 2
+    format: str = "PNG"
+    quality: int = 85
+    optimize: bool = True
+
+    @classmethod
+    def from_env(cls) -> "RenderOptions":
+        image_format = (getenv("SCHEDULE_FORMAT") or cls.format).upper()
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"SCHEDULE_FORMAT должен быть одним из {', '.join(IMAGE_FORMATS)}")
+        return cls(
+            scale=float(getenv("SCHEDULE_SCALE") or cls.scale),
+            format=image_format,
+            quality=int(getenv("SCHEDULE_QUALITY") or cls.quality),
+        )
+
+    @property
+    def extension(self) -> str:
+        return IMAGE_FORMATS[self.format]
+
+    @property
+    def tag(self) -> str:
+        """Часть имени каталога кэша: страницы с разными параметрами не смешиваются"""
+        return f"{self.format.lower()}_x{self.scale:g}_q{self.quality}"
+
+
+RENDER_OPTIONS = RenderOptions.from_env()
+_render_pool: Optional[ProcessPoolExecutor] = None
+
+# Один рендер документа за раз, чтобы ревизии не удаляли каталоги друг друга
+_render_locks: Dict[str, asyncio.Lock] = {}
+# Идущие рендеры по каталогу ревизии: одновременные запросы читают страницы одного рендера
+_render_jobs: Dict[Path, "_RenderJob"] = {}
+# Сколько запросов сейчас читают страницы каталога ревизии: такие каталоги
+# не удаляются при сохранении новой ревизии, их уберёт следующий рендер
+_page_readers: Dict[Path, int] = {}
+
+
+class _RenderJob:
+    """Рендер одной ревизии в фоне. Не зависит от скорости отправки страниц:
+    запросы читают готовые страницы независимо друг от друга"""
+
+    def __init__(self):
+        # Путь к сохранённой странице или сами байты, если записать на диск не удалось
+        self.pages: List[Union[Path, bytes]] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, page: Union[Path, bytes]) -> None:
+        async with self._changed:
+            self.pages.append(page)
+            self._changed.notify_all()
+
+    async def finish(self, error: Optional[BaseException] = None) -> None:
+        async with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+    async def follow(self) -> AsyncIterator[bytes]:
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: index < len(self.pages) or self.done)
+                if index < len(self.pages):
+                    page = self.pages[index]
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            index += 1
+            yield await asyncio.to_thread(page.read_bytes) if isinstance(page, Path) else page
+
+
+async def get_schedule_metadata(credentials_path: str, document_id: str) -> dict:
+    """Метаданные документа расписания в Drive (mimeType, version, modifiedTime)"""
+    token = await get_token_provider(credentials_path).get_token([DRIVE_SCOPE])
+    try:
+        return await asyncio.wait_for(get_file_metadata(token, document_id), timeout=METADATA_TIMEOUT)
+    except HTTPStatusError as exc:
+        _log_drive_error(exc)
+        raise
+
+
+def schedule_revision(metadata: dict) -> str:
+    """Ревизия документа: меняется при каждой правке"""
+    return str(metadata.get("version") or metadata.get("modifiedTime") or "")
+
+
+async def stream_schedule_pages(
+    credentials_path: str,
+    document_id: str,
+    metadata: Optional[dict] = None,
+    options: RenderOptions = RENDER_OPTIONS,
+) -> AsyncIterator[bytes]:
+    """Страницы расписания в формате `options.format` по одной, по мере готовности.
+    Документ скачивается и рендерится заново только при смене его ревизии
+    в Drive; иначе страницы читаются с диска. Рендер идёт в фоне, одновременные
+    запросы получают страницы одного рендера и не ждут отправки друг друга."""
+    if metadata is None:
+        metadata = await get_schedule_metadata(credentials_path, document_id)
+
+    revision = schedule_revision(metadata)
+    cache_dir = _revision_dir(document_id, revision, options)
+
+    _page_readers[cache_dir] = _page_readers.get(cache_dir, 0) + 1
+    try:
+        page_files = await asyncio.to_thread(_cached_page_files, cache_dir) if revision else None
+        if page_files is not None:
+            for page_file in page_files:
+                yield await asyncio.to_thread(page_file.read_bytes)
+            return
+
+        job = _render_jobs.get(cache_dir)
+        if job is None:
+            job = _render_jobs[cache_dir] = _RenderJob()
+            job.task = asyncio.create_task(
+                _render_revision(job, credentials_path, document_id, metadata, cache_dir, options)
+            )
+        async for page in job.follow():
+            yield page
+    finally:
+        _page_readers[cache_dir] -= 1
+        if not _page_readers[cache_dir]:
+            del _page_readers[cache_dir]
+
+
+async def _render_revision(
+    job: _RenderJob,
+    credentials_path: str,
+    document_id: str,
+    metadata: dict,
+    cache_dir: Path,
+    options: RenderOptions,
+) -> None:
+    """Скачать, отрендерить и сохранить ревизию, публикуя страницы в `job`"""
+    revision = schedule_revision(metadata)
+    error: Optional[BaseException] = None
+    try:
+        async with _render_locks.setdefault(document_id, asyncio.Lock()):
+            # Пока ждали блокировку, ревизию мог сохранить предыдущий рендер
+            page_files = await asyncio.to_thread(_cached_page_files, cache_dir) if revision else None
+            if page_files is not None:
+                for page_file in page_files:
+                    await job.publish(page_file)
+                return
 
-    async with aiohttp.ClientSession() as session:
-        mime_type = await _get_mime_type(session, headers, document_id)
+            logger.info(f"Рендерю расписание {document_id}, ревизия {revision or '?'}")
+            pdf_bytes = await asyncio.wait_for(
+                _fetch_pdf(credentials_path, document_id, metadata.get("mimeType", "")),
+                timeout=DOWNLOAD_TIMEOUT,
+            )
+
+            persist = bool(revision) and await asyncio.to_thread(_start_revision, cache_dir)
+            index = 0
+            async for page in _render_pages(pdf_bytes, options):
+                index += 1
+                if persist:
+                    persist = await asyncio.to_thread(_write_page, cache_dir, index, page, options.extension)
+                page_path = cache_dir / PAGE_FILE_PATTERN.format(index=index, extension=options.extension)
+                await job.publish(page_path if persist else page)
+
+            if persist:
+                await asyncio.to_thread(_finish_revision, cache_dir, set(_page_readers))
+    except Exception as exc:
+        error = exc
+    except BaseException:
+        error = RuntimeError(f"Рендер расписания {document_id} прерван")
+        raise
+    finally:
+        if _render_jobs.get(cache_dir) is job:
+            del _render_jobs[cache_dir]
+        await job.finish(error)
+
+
+async def _fetch_pdf(credentials_path: str, document_id: str, mime_type: str) -> bytes:
+    token = await get_token_provider(credentials_path).get_token([DRIVE_SCOPE])
+    return await _download_pdf(token, document_id, mime_type)
+
+
+async def _download_pdf(token: str, document_id: str, mime_type: str) -> bytes:
+    headers = {"Authorization": f"Bearer {token}"}
+
+    try:
         if mime_type.startswith("application/vnd.google-apps."):
-            return await _export_google_doc(session, headers, document_id)
+            return await _export_google_doc(headers, document_id)
         if mime_type == "application/pdf":
-            return await _download_existing_pdf(session, headers, document_id)
+            return await _download_existing_pdf(headers, document_id)
+    except HTTPStatusError as exc:
+        _log_drive_error(exc)
+        raise
 
-        message = (
-            "Drive file must be a Google Doc or PDF; received mimeType=%s" % mime_type
-        )
-        logger.error(message)
-        raise ValueError(message)
-
-
-async def _get_mime_type(
-    session: aiohttp.ClientSession, headers: dict, document_id: str
-) -> str:
-    url = METADATA_URL.format(file_id=document_id)
-    async with session.get(url, headers=headers) as response:
-        if response.status >= 400:
-            await _log_drive_error(response)
-            response.raise_for_status()
-        data = await response.json()
-        mime_type = data.get("mimeType")
-        if not mime_type:
-            raise ValueError("Drive file metadata does not include mimeType")
-        return mime_type
-
-
-async def _export_google_doc(
-    session: aiohttp.ClientSession, headers: dict, document_id: str
-) -> bytes:
+    message = (
+        "Drive file must be a Google Doc or PDF; received mimeType=%s" % mime_type
+    )
+    logger.error(message)
+    raise ValueError(message)
+
+
+def _revision_dir(document_id: str, revision: str, options: RenderOptions) -> Path:
+    safe_revision = "".join(ch if ch.isalnum() else "_" for ch in revision)
+    return CACHE_DIR / document_id / f"{safe_revision}_{options.tag}"
+
+
+def _cached_page_files(cache_dir: Path) -> Optional[List[Path]]:
+    """Файлы страниц на диске; None, если ревизия не была полностью сохранена"""
+    if not (cache_dir / COMPLETE_MARKER).exists():
+        return None
+    return sorted(cache_dir.glob("page_*"))
+
+
+def _start_revision(cache_dir: Path) -> bool:
+    """Подготовить каталог ревизии, удалив остатки прерванного рендера"""
+    try:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        return True
+    except OSError as exc:
+        logger.error(f"Не удалось создать кэш расписания {cache_dir}: {exc}")
+        return False
+
+
+def _write_page(cache_dir: Path, index: int, page: bytes, extension: str) -> bool:
+    try:
+        (cache_dir / PAGE_FILE_PATTERN.format(index=index, extension=extension)).write_bytes(page)
+        return True
+    except OSError as exc:
+        logger.error(f"Не удалось сохранить страницу расписания в кэш {cache_dir}: {exc}")
+        return False
+
+
+def _finish_revision(cache_dir: Path, in_use: Set[Path]) -> None:
+    """Отметить ревизию сохранённой целиком и удалить старые ревизии документа,
+    кроме тех, что сейчас читаются (`in_use`)"""
+    try:
+        (cache_dir / COMPLETE_MARKER).touch()
+        for old_dir in cache_dir.parent.iterdir():
+            if old_dir != cache_dir and old_dir not in in_use and old_dir.is_dir():
+                shutil.rmtree(old_dir, ignore_errors=True)
+    except OSError as exc:
+        logger.error(f"Не удалось сохранить расписание в кэш {cache_dir}: {exc}")
+
+
+async def _export_google_doc(headers: dict, document_id: str) -> bytes:
     url = EXPORT_URL.format(file_id=document_id)
-    async with session.get(url, headers=headers) as response:
-        if response.status >= 400:
-            await _log_drive_error(response)
-            response.raise_for_status()
-        return await response.read()
+    return await http_client.get_bytes(url, headers=headers)
 
 
-async def _download_existing_pdf(
-    session: aiohttp.ClientSession, headers: dict, document_id: str
-) -> bytes:
+async def _download_existing_pdf(headers: dict, document_id: str) -> bytes:
     url = DOWNLOAD_URL.format(file_id=document_id)
-    async with session.get(url, headers=headers) as response:
-        if response.status >= 400:
-            await _log_drive_error(response)
-            response.raise_for_status()
-        return await response.read()
+    return await http_client.get_bytes(url, headers=headers)
 
 
-async def _log_drive_error(response: aiohttp.ClientResponse) -> None:
-    error_text = await response.text()
+def _log_drive_error(error: HTTPStatusError) -> None:
     logger.error(
         "Drive request failed: status=%s body=%s",
-        response.status,
-        error_text.strip(),
+        error.status,
+        error.text.strip(),
     )
 
 
-def _pdf_to_png(pdf_bytes: bytes) -> List[bytes]:
-    """Рендерим каждую страницу PDF в PNG с помощью pdfium."""
-    document = pdfium.PdfDocument(pdf_bytes)
-    images: List[bytes] = []
+async def _render_pages(pdf_bytes: bytes, options: RenderOptions) -> AsyncIterator[bytes]:
+    """Рендерим страницы PDF в пуле процессов и отдаём их по порядку, как только
+    готова очередная. В работе одновременно не больше RENDER_WORKERS страниц,
+    поэтому в памяти держится только это окно, а не весь документ."""
+    loop = asyncio.get_running_loop()
+    executor = _get_render_pool()
+    # Число страниц читается из заголовков без рендера: пересылать весь PDF в пул ради него незачем
+    page_count = count_pages(pdf_bytes)
+
+    pending: Deque[asyncio.Future] = deque()
+    next_index = 0
+    try:
+        while next_index < page_count or pending:
+            while next_index < page_count and len(pending) < RENDER_WORKERS:
+                pending.append(loop.run_in_executor(
+                    executor, render_page, pdf_bytes, next_index,
+                    options.scale, options.format, options.quality, options.optimize,
+                ))
+                next_index += 1
+            yield await pending.popleft()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _get_render_pool() -> ProcessPoolExecutor:
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(
+            max_workers=RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _render_pool
 
-    for page_index in range(len(document)):
-        page = document.get_page(page_index)
-        bitmap = page.render(scale=2)
-        pil_image = bitmap.to_pil()
-        buffer = io.BytesIO()
-        pil_image.save(buffer, format="PNG")
-        images.append(buffer.getvalue())
-        buffer.close()
-        page.close()
 
-    document.close()
-    return images
+def shutdown_render_pool() -> None:
+    """Остановить пул рендеринга (при завершении бота)"""
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
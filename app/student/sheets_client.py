@@ -0,0 +1,67 @@
+from typing import List, Optional
+
+from app.http_client import HTTPStatusError, HttpClient, http_client
+from app.logger import logger
+
+SHEETS_API_URL = "https://sheets.googleapis.com/v4/spreadsheets"
+
+# Запрашиваем только значения: без метаданных ответ заметно меньше
+DEFAULT_FIELDS = "valueRanges(range,values)"
+DEFAULT_VALUE_RENDER_OPTION = "FORMATTED_VALUE"
+DEFAULT_TIMEOUT = 15
+
+
+def a1_range(sheet_name: str, range_str: str) -> str:
+    """Диапазон в A1-нотации с экранированным именем листа"""
+    escaped = sheet_name.replace("'", "''")
+    return f"'{escaped}'!{range_str}"
+
+
+class SheetsClient:
+    """Клиент чтения значений Google Sheets через `values:batchGet`.
+
+    Все диапазоны одной таблицы возвращаются одним запросом; запросы к разным
+    таблицам вызывающий код выполняет параллельно. `base_url` можно направить
+    на локальную заглушку API.
+    """
+
+    def __init__(
+        self,
+        base_url: str = SHEETS_API_URL,
+        fields: Optional[str] = DEFAULT_FIELDS,
+        value_render_option: str = DEFAULT_VALUE_RENDER_OPTION,
+        timeout: float = DEFAULT_TIMEOUT,
+        client: HttpClient = http_client,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.fields = fields
+        self.value_render_option = value_render_option
+        self.timeout = timeout
+        self.client = client
+
+    async def batch_get(
+        self, token: str, spreadsheet_id: str, ranges: List[str]
+    ) -> List[List[List[str]]]:
+        """Получить значения диапазонов одной таблицы в порядке `ranges`"""
+        url = f"{self.base_url}/{spreadsheet_id}/values:batchGet"
+        headers = {"Authorization": f"Bearer {token}"}
+        params = [("ranges", range_) for range_ in ranges]
+        params.append(("valueRenderOption", self.value_render_option))
+        params.append(("majorDimension", "ROWS"))
+        if self.fields:
+            params.append(("fields", self.fields))
+
+        try:
+            data = await self.client.get_json(
+                url, headers=headers, params=params, timeout=self.timeout
+            )
+        except HTTPStatusError as exc:
+            logger.error(f"Ошибка API Google Sheets: {exc.status}")
+            logger.error(f"Ответ: {exc.text[:300]}")
+            raise
+
+        value_ranges = data.get("valueRanges", [])
+        values = [value_range.get("values", []) for value_range in value_ranges]
+        # Пустые диапазоны в конце ответа API может не вернуть
+        values.extend([] for _ in range(len(ranges) - len(values)))
+        return values
@@ -1,10 +1,16 @@
-import aiohttp
+import asyncio
+import json
 import re
 import time
-from typing import Dict, Optional, Tuple, List
-from google.oauth2 import service_account
-from google.auth.transport.requests import Request
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Optional, List
+from app.cache import CacheManager
+from app.database import db
+from app.google_auth import DRIVE_SCOPE, SHEETS_SCOPE, get_token_provider
+from app.google_drive import get_file_metadata
 from app.logger import logger
+from app.singleflight import SingleFlight
+from app.student.sheets_client import SheetsClient, a1_range
 
 # ID таблиц Google Sheets
 SHEETS_CONFIG = {
@@ -12,93 +18,133 @@ SHEETS_CONFIG = {
         'id': '117QNcwjcsQ1ScFlTbOm6oOcPlXiMefR8rNgb15dA8Ms',
         'sheet_name': 'осень 2025',
         'range': 'A:F',
-        'header_rows': 4
+        'header_rows': 4,
+        'student_number_col': 2,
+        'fio_col': None
     },
     'travel_compensation': {
         'id': '18NYYQNvdJINpUXvoPH1_MHqldH4GfgdWEPrGqMkPtUU',
         'sheet_name': 'осень 2025',
         'range': 'A:E',
-        'header_rows': 8
+        'header_rows': 8,
+        'student_number_col': 1,
+        'fio_col': 0
     },
     'housing_compensation': {
         'id': '1gmM_hJocQ1tfz5Pzu8SNhvt-s1u739sJgVKjFCXVETs',
         'sheet_name': 'осень 2025',
         'range': 'A:D',
-        'header_rows': 4
+        'header_rows': 4,
+        'student_number_col': None,
+        'fio_col': 1
     }
 }
 
-DRIVE_SCOPE = "https://www.googleapis.com/auth/drive.readonly"
-SHEETS_SCOPE = "https://www.googleapis.com/auth/spreadsheets.readonly"
-SHEETS_API_URL = "https://sheets.googleapis.com/v4/spreadsheets"
-
 CACHE_TTL = 3600
 DEFAULT_CACHE_TTL = 1800
+# Обновление дешёвое: без изменений в таблице запрашиваются только метаданные Drive
+REFRESH_INTERVAL = 120
+SHEET_TIMEOUT = 15
+# Предел на обновление одной таблицы (метаданные, batchGet, запись в БД) и на цикл
+# фонового обновления: зависший запрос не должен навсегда занять обновление
+REFRESH_TIMEOUT = 4 * SHEET_TIMEOUT
 
+NOT_SUBMITTED = {'found': False, 'status': 'not_submitted', 'text': 'Заявление не подано'}
+LOAD_ERROR = {'found': False, 'status': 'error', 'text': 'Ошибка загрузки'}
 
-class CacheManager:
-    """Менеджер кэша для Google Sheets данных"""
-    
-    def __init__(self, ttl: int = CACHE_TTL):
-        self.ttl = ttl
-        self._cache: Dict[str, Tuple[Dict, float]] = {}
-    
-    def get(self, key: str) -> Optional[Dict]:
-        """Получить значение из кэша если оно актуально"""
-        if key not in self._cache:
-            return None
-        
-        value, timestamp = self._cache[key]
-        if time.time() - timestamp > self.ttl:
-            del self._cache[key]
-            return None
-        
-        return value
-    
-    def set(self, key: str, value: Dict) -> None:
-        """Сохранить значение в кэш с текущим временем"""
-        self._cache[key] = (value, time.time())
-    
-    def clear(self) -> None:
-        """Очистить весь кэш"""
-        self._cache.clear()
-    
-    def invalidate(self, key: str) -> None:
-        """Удалить конкретный ключ из кэша"""
-        if key in self._cache:
-            del self._cache[key]
+
+def _normalize_student_number(num: str) -> str:
+    """Нормализация номера студенческого для сравнения"""
+    return re.sub(r'\s+', '', num.upper().strip())
+
+
+def _normalize_surname(surname: str) -> str:
+    """Нормализация фамилии для сравнения"""
+    return surname.strip().lower()
+
+
+def _surname_initial_key(surname: str, name: str) -> str:
+    """Ключ вида «иванов и» по фамилии и имени (или инициалам)"""
+    name = name.strip()
+    initial = name[0].lower() if name else ''
+    return f"{_normalize_surname(surname)} {initial}"
+
+
+@dataclass
+class SheetSnapshot:
+    """Снимок листа Google Sheets с хэш-индексами для поиска за O(1)"""
+    sheet_key: str
+    rows: List[List[str]]
+    fetched_at: float
+    version: Optional[str] = None
+    by_student_number: Dict[str, List[str]] = field(default_factory=dict)
+    by_surname: Dict[str, List[str]] = field(default_factory=dict)
+    by_surname_initial: Dict[str, List[str]] = field(default_factory=dict)
+
+    @property
+    def age(self) -> float:
+        """Возраст снимка в секундах"""
+        return time.time() - self.fetched_at
+
+    @classmethod
+    def build(
+        cls,
+        sheet_key: str,
+        rows: List[List[str]],
+        fetched_at: Optional[float] = None,
+        version: Optional[str] = None
+    ) -> 'SheetSnapshot':
+        """Построить индексы по строкам листа (без строк заголовка)"""
+        config = SHEETS_CONFIG[sheet_key]
+        snapshot = cls(
+            sheet_key=sheet_key,
+            rows=rows,
+            fetched_at=time.time() if fetched_at is None else fetched_at,
+            version=version
+        )
+
+        number_col = config['student_number_col']
+        fio_col = config['fio_col']
+
+        # При дубликатах побеждает первая строка — как при линейном поиске
+        for row in rows[config['header_rows']:]:
+            if number_col is not None and len(row) > number_col:
+                number = _normalize_student_number(row[number_col])
+                if number:
+                    snapshot.by_student_number.setdefault(number, row)
+
+            if fio_col is not None and len(row) > fio_col:
+                parts = row[fio_col].split()
+                if parts:
+                    snapshot.by_surname.setdefault(_normalize_surname(parts[0]), row)
+                if len(parts) >= 2:
+                    snapshot.by_surname_initial.setdefault(
+                        _surname_initial_key(parts[0], parts[1]), row
+                    )
+
+        return snapshot
 
 
 class ApplicationStatusChecker:
-    """Проверка статусов заявлений студентов в Google Sheets с кэшированием"""
+    """Проверка статусов заявлений студентов в Google Sheets с кэшированием.
+
+    Каждый лист из SHEETS_CONFIG хранится в кэше как проиндексированный снимок,
+    общий для всех студентов. Снимки обновляет фоновая задача `run_refresher`;
+    поиск всегда отвечает по последнему удачному снимку, даже если он устарел.
+    """
 
     def __init__(self, credentials_path: str, cache_ttl: int = CACHE_TTL):
         self.credentials_path = credentials_path
-        self._token = None
-        self._token_expiry = 0
-        self.cache = CacheManager(ttl=cache_ttl)
+        self.tokens = get_token_provider(credentials_path)
+        self.cache = CacheManager(ttl=cache_ttl, keep_stale=True, name="status_sheets")
+        self.sheets = SheetsClient(timeout=SHEET_TIMEOUT)
+        self._refresh_errors: Dict[str, Dict] = {}
+        self._sheet_flights = SingleFlight()
+        self._status_flights = SingleFlight()
 
-    async def _get_access_token(self, force_refresh: bool = False) -> str:
-        """Получить актуальный access token для Google API с кэшированием"""
-        current_time = time.time()
-        
-        if self._token and current_time < self._token_expiry and not force_refresh:
-            return self._token
-        
-        try:
-            logger.info(f"Получаю новый токен из {self.credentials_path}")
-            creds = service_account.Credentials.from_service_account_file(
-                self.credentials_path,
-                scopes=[DRIVE_SCOPE, SHEETS_SCOPE]
-            )
-            creds.refresh(Request())
-            self._token = creds.token
-            self._token_expiry = current_time + 3500
-            logger.info(f"Токен получен успешно")
-            return self._token
-        except Exception as exc:
-            logger.error(f"Ошибка получения access token: {exc}")
-            raise
+    async def _get_access_token(self) -> str:
+        """Получить актуальный access token для Google Sheets API"""
+        return await self.tokens.get_token([SHEETS_SCOPE])
 
     async def get_all_statuses(
         self, 
@@ -107,154 +153,321 @@ class ApplicationStatusChecker:
         first_name: str,
         use_cache: bool = True
     ) -> Dict[str, Dict]:
-        """Получить статусы по всем трём выплатам"""
-        cache_key = f"{student_number}:{last_name}:{first_name}"
-        
-        if use_cache:
-            cached = self.cache.get(cache_key)
-            if cached is not None:
-                logger.info(f"Вернул статусы из кэша для {student_number}")
-                return cached
-        
-        results = {}
-        
+        """Получить статусы по всем трём выплатам.
+
+        К каждому найденному статусу добавляются `age` (возраст данных в секундах)
+        и `stale` (данные устарели или последнее обновление не удалось).
+        """
+        checks = {
+            'material_help': lambda snapshot: self._check_material_help(
+                snapshot, student_number
+            ),
+            'travel_compensation': lambda snapshot: self._check_travel_compensation(
+                snapshot, student_number, last_name
+            ),
+            'housing_compensation': lambda snapshot: self._check_housing_compensation(
+                snapshot, last_name, first_name
+            ),
+        }
+
+        async def collect() -> Dict[str, Dict]:
+            statuses = await asyncio.gather(*(
+                self._get_sheet_status(sheet_key, check, force_refresh=not use_cache)
+                for sheet_key, check in checks.items()
+            ))
+            return dict(zip(checks, statuses))
+
+        # Повторные нажатия одного студента во время проверки ждут её результат
+        cache_key = f"{student_number}:{last_name}:{first_name}:{use_cache}"
+        results = await self._status_flights.do(cache_key, collect)
+        return {sheet_key: dict(status) for sheet_key, status in results.items()}
+
+    async def _get_sheet_status(
+        self,
+        sheet_key: str,
+        check: Callable[[SheetSnapshot], Dict],
+        force_refresh: bool = False
+    ) -> Dict:
+        """Статус по одному листу. Ошибка или таймаут листа не влияют на остальные"""
         try:
-            token = await self._get_access_token()
-            
-            results['material_help'] = await self._check_material_help(
-                token, student_number, last_name, first_name
+            snapshot = await asyncio.wait_for(
+                self._get_snapshot(sheet_key, force_refresh=force_refresh),
+                timeout=SHEET_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"Таймаут загрузки листа {sheet_key}")
+            self._refresh_errors[sheet_key] = {'status': None, 'text': 'timeout'}
+            snapshot = self._cached_snapshot(sheet_key)
+        except Exception as exc:
+            logger.error(f"Ошибка при проверке статусов ({sheet_key}): {exc}")
+            snapshot = self._cached_snapshot(sheet_key)
+
+        if snapshot is None:
+            return dict(LOAD_ERROR)
+
+        result = check(snapshot)
+        result['age'] = snapshot.age
+        result['stale'] = self.is_stale(sheet_key)
+        return result
+
+    def is_stale(self, sheet_key: str) -> bool:
+        """Снимок листа просрочен или его последнее обновление завершилось ошибкой"""
+        return sheet_key in self._refresh_errors or not self.cache.is_fresh(sheet_key)
+
+    def _cached_snapshot(self, sheet_key: str) -> Optional[SheetSnapshot]:
+        """Последний удачный снимок листа, независимо от его возраста"""
+        entry = self.cache.get_stale(sheet_key)
+        return entry[0] if entry is not None else None
+
+    async def _get_snapshot(
+        self,
+        sheet_key: str,
+        force_refresh: bool = False
+    ) -> Optional[SheetSnapshot]:
+        """Получить снимок листа; загрузка выполняется только при холодном кэше"""
+        snapshot = None if force_refresh else self._cached_snapshot(sheet_key)
+        if snapshot is not None:
+            return snapshot
+
+        token = await self._get_access_token()
+        snapshots = await self._refresh_sheets([sheet_key], token)
+        return snapshots.get(sheet_key) or self._cached_snapshot(sheet_key)
+
+    async def _refresh_sheets(self, sheet_keys: List[str], token: str) -> Dict[str, SheetSnapshot]:
+        """Загрузить и проиндексировать листы: один batchGet на таблицу, таблицы параллельно.
+
+        Для листов, которые не удалось загрузить, прежний снимок сохраняется.
+        """
+        keys_by_spreadsheet: Dict[str, List[str]] = {}
+        for sheet_key in sheet_keys:
+            keys_by_spreadsheet.setdefault(SHEETS_CONFIG[sheet_key]['id'], []).append(sheet_key)
+
+        results = await asyncio.gather(*(
+            self._refresh_spreadsheet(spreadsheet_id, keys, token)
+            for spreadsheet_id, keys in keys_by_spreadsheet.items()
+        ))
+
+        snapshots: Dict[str, SheetSnapshot] = {}
+        for result in results:
+            snapshots.update(result)
+        return snapshots
+
+    async def _refresh_spreadsheet(
+        self,
+        spreadsheet_id: str,
+        sheet_keys: List[str],
+        token: str
+    ) -> Dict[str, SheetSnapshot]:
+        """Обновить листы одной таблицы. Одновременные одинаковые обновления
+        выполняются один раз, остальные вызовы ждут общий результат"""
+        return await self._sheet_flights.do(
+            (spreadsheet_id, tuple(sheet_keys)),
+            lambda: self._fetch_spreadsheet_bounded(spreadsheet_id, sheet_keys, token)
+        )
+
+    async def _fetch_spreadsheet_bounded(
+        self,
+        spreadsheet_id: str,
+        sheet_keys: List[str],
+        token: str
+    ) -> Dict[str, SheetSnapshot]:
+        """_fetch_spreadsheet с пределом REFRESH_TIMEOUT: общий вызов всегда
+        завершается, и следующее обновление не присоединяется к зависшему"""
+        try:
+            return await asyncio.wait_for(
+                self._fetch_spreadsheet(spreadsheet_id, sheet_keys, token),
+                timeout=REFRESH_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"Таймаут обновления таблицы {spreadsheet_id}, остаются прежние данные")
+            for sheet_key in sheet_keys:
+                self._refresh_errors[sheet_key] = {'status': None, 'text': 'timeout'}
+            return {}
+
+    async def _fetch_spreadsheet(
+        self,
+        spreadsheet_id: str,
+        sheet_keys: List[str],
+        token: str
+    ) -> Dict[str, SheetSnapshot]:
+        version = await self._get_spreadsheet_version(spreadsheet_id)
+        cached = [self._cached_snapshot(key) for key in sheet_keys]
+        if version is not None and all(
+            snapshot is not None and snapshot.version == version for snapshot in cached
+        ):
+            return await self._confirm_unchanged(cached)
+
+        ranges = [
+            a1_range(SHEETS_CONFIG[key]['sheet_name'], SHEETS_CONFIG[key]['range'])
+            for key in sheet_keys
+        ]
+        try:
+            response = await self.sheets.batch_get(token, spreadsheet_id, ranges)
+        except Exception as exc:
+            for sheet_key in sheet_keys:
+                self._refresh_errors[sheet_key] = {
+                    'status': getattr(exc, 'status', None),
+                    'text': str(exc) or type(exc).__name__
+                }
+                logger.warning(
+                    f"Лист {sheet_key} не обновлён ({exc!r}), остаются прежние данные"
+                )
+            return {}
+
+        snapshots: Dict[str, SheetSnapshot] = {}
+        for sheet_key, rows in zip(sheet_keys, response):
+            snapshot = SheetSnapshot.build(sheet_key, rows, version=version)
+            self.cache.set(sheet_key, snapshot)
+            self._refresh_errors.pop(sheet_key, None)
+            snapshots[sheet_key] = snapshot
+            logger.info(f"Лист {sheet_key} загружен: {len(rows)} строк")
+
+        await self._persist_snapshots(snapshots.values())
+        return snapshots
+
+    async def _get_spreadsheet_version(self, spreadsheet_id: str) -> Optional[str]:
+        """Версия таблицы по метаданным Drive; None, если узнать не удалось"""
+        try:
+            token = await self.tokens.get_token([DRIVE_SCOPE])
+            metadata = await asyncio.wait_for(
+                get_file_metadata(token, spreadsheet_id, fields="version,modifiedTime"),
+                timeout=SHEET_TIMEOUT
             )
-            
-            results['travel_compensation'] = await self._check_travel_compensation(
-                token, student_number, last_name, first_name
+        except Exception as exc:
+            logger.warning(f"Не удалось получить версию таблицы {spreadsheet_id}: {exc!r}")
+            return None
+
+        version = metadata.get('version') or metadata.get('modifiedTime')
+        return str(version) if version else None
+
+    async def _confirm_unchanged(self, snapshots: List[SheetSnapshot]) -> Dict[str, SheetSnapshot]:
+        """Таблица не менялась: продлеваем снимки без повторной загрузки значений"""
+        now = time.time()
+        for snapshot in snapshots:
+            snapshot.fetched_at = now
+            self.cache.set(snapshot.sheet_key, snapshot, timestamp=now)
+            self._refresh_errors.pop(snapshot.sheet_key, None)
+
+        keys = [snapshot.sheet_key for snapshot in snapshots]
+        logger.info(f"Листы {', '.join(keys)} не изменились (версия {snapshots[0].version})")
+        try:
+            await db.execute(
+                "UPDATE sheet_snapshots SET fetched_at = to_timestamp($2) WHERE sheet_key = ANY($1::text[])",
+                keys, now
             )
-            
-            results['housing_compensation'] = await self._check_housing_compensation(
-                token, last_name, first_name
+        except Exception as exc:
+            logger.error(f"Не удалось обновить время снимков {', '.join(keys)}: {exc}")
+
+        return {snapshot.sheet_key: snapshot for snapshot in snapshots}
+
+    async def _persist_snapshots(self, snapshots: Iterable[SheetSnapshot]) -> None:
+        """Сохранить снимки в БД, чтобы после перезапуска не начинать с пустого кэша"""
+        for snapshot in snapshots:
+            try:
+                await db.execute(
+                    """
+                    INSERT INTO sheet_snapshots (sheet_key, rows, fetched_at, version)
+                    VALUES ($1, $2::jsonb, to_timestamp($3), $4)
+                    ON CONFLICT (sheet_key) DO UPDATE
+                    SET rows = EXCLUDED.rows,
+                        fetched_at = EXCLUDED.fetched_at,
+                        version = EXCLUDED.version
+                    """,
+                    snapshot.sheet_key,
+                    json.dumps(snapshot.rows, ensure_ascii=False),
+                    snapshot.fetched_at,
+                    snapshot.version
+                )
+            except Exception as exc:
+                logger.error(f"Не удалось сохранить снимок листа {snapshot.sheet_key}: {exc}")
+
+    async def load_persisted(self) -> None:
+        """Загрузить сохранённые в БД снимки листов (при старте бота)"""
+        try:
+            records = await db.fetch(
+                """
+                SELECT sheet_key, rows, version, EXTRACT(EPOCH FROM fetched_at) AS fetched_at
+                FROM sheet_snapshots
+                """
             )
-            
-            if use_cache:
-                self.cache.set(cache_key, results)
-            
         except Exception as exc:
-            logger.error(f"Ошибка при проверке статусов: {exc}")
-            results = {
-                'material_help': {'found': False, 'status': 'error', 'text': 'Ошибка загрузки'},
-                'travel_compensation': {'found': False, 'status': 'error', 'text': 'Ошибка загрузки'},
-                'housing_compensation': {'found': False, 'status': 'error', 'text': 'Ошибка загрузки'}
-            }
-        
-        return results
+            logger.error(f"Не удалось загрузить сохранённые снимки листов: {exc}")
+            return
 
-    async def _get_sheet_data(
-        self, 
-        token: str, 
-        sheet_id: str, 
-        sheet_name: str, 
-        range_str: str
-    ) -> Tuple[List[List], Optional[Dict]]:
-        """Получить данные из Google Sheets"""
+        for record in records:
+            sheet_key = record['sheet_key']
+            if sheet_key not in SHEETS_CONFIG or self._cached_snapshot(sheet_key) is not None:
+                continue
+
+            fetched_at = float(record['fetched_at'])
+            snapshot = SheetSnapshot.build(
+                sheet_key, json.loads(record['rows']), fetched_at, version=record['version']
+            )
+            self.cache.set(sheet_key, snapshot, timestamp=fetched_at)
+            logger.info(
+                f"Лист {sheet_key} восстановлен из БД, возраст {int(snapshot.age)} сек"
+            )
+
+    async def refresh_all(self) -> None:
+        """Обновить снимки всех листов из SHEETS_CONFIG"""
         try:
-            url = f"{SHEETS_API_URL}/{sheet_id}/values/{sheet_name}!{range_str}"
-            headers = {"Authorization": f"Bearer {token}"}
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        values = data.get('values', [])
-                        return values, None
-                    else:
-                        text = await response.text()
-                        logger.error(f"Ошибка API Google Sheets: {response.status}")
-                        logger.error(f"Ответ: {text[:300]}")
-                        return [], None
+            token = await self._get_access_token()
         except Exception as exc:
-            logger.error(f"Ошибка получения данных из Sheets: {exc}")
-            return [], None
+            for sheet_key in SHEETS_CONFIG:
+                self._refresh_errors[sheet_key] = {'status': None, 'text': str(exc)}
+            return
 
-    async def _check_material_help(
-        self, 
-        token: str, 
-        student_number: str, 
-        last_name: str, 
-        first_name: str
-    ) -> Dict:
+        await self._refresh_sheets(list(SHEETS_CONFIG), token)
+
+    async def run_refresher(self, interval: int = REFRESH_INTERVAL) -> None:
+        """Фоновая задача: периодически обновляет все листы"""
+        logger.info(f"Запущено фоновое обновление статусов (раз в {interval} сек)")
+        while True:
+            try:
+                await asyncio.wait_for(self.refresh_all(), timeout=REFRESH_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.error(f"Фоновое обновление статусов не уложилось в {REFRESH_TIMEOUT} сек")
+            except Exception as exc:
+                logger.error(f"Ошибка фонового обновления статусов: {exc}")
+            await asyncio.sleep(interval)
+
+    def _check_material_help(self, snapshot: SheetSnapshot, student_number: str) -> Dict:
         """Проверка статуса материальной помощи - СТРОГО ПО НОМЕРУ БИЛЕТА"""
-        config = SHEETS_CONFIG['material_help']
-        rows, _ = await self._get_sheet_data(token, config['id'], config['sheet_name'], config['range'])
-        
-        if not rows:
-            return {'found': False, 'status': 'not_submitted', 'text': 'Заявление не подано'}
-        
-        data_rows = rows[config['header_rows']:] if len(rows) > config['header_rows'] else []
-        
-        # СТРОГО ищем только по номеру студенческого билета (колонка 3, индекс 2)
-        normalized_student_number = self._normalize_student_number(student_number)
-        for idx, row in enumerate(data_rows):
-            if len(row) >= 3:
-                row_student_num = self._normalize_student_number(row[2] if len(row) > 2 else '')
-                if row_student_num == normalized_student_number and row_student_num:  # Не пустая строка
-                    return self._parse_material_help_row(row)
-        
-        # Не нашли по билету → заявление не подано
-        return {'found': False, 'status': 'not_submitted', 'text': 'Заявление не подано'}
+        normalized_student_number = _normalize_student_number(student_number)
+        row = snapshot.by_student_number.get(normalized_student_number)
+        if row is not None:
+            return self._parse_material_help_row(row)
 
+        # Не нашли по билету → заявление не подано
+        return dict(NOT_SUBMITTED)
 
-    async def _check_travel_compensation(
+    def _check_travel_compensation(
         self, 
-        token: str, 
+        snapshot: SheetSnapshot, 
         student_number: str, 
-        last_name: str, 
-        first_name: str
+        last_name: str
     ) -> Dict:
-        """Проверка статуса компенсации проезда"""
-        config = SHEETS_CONFIG['travel_compensation']
-        rows, _ = await self._get_sheet_data(token, config['id'], config['sheet_name'], config['range'])
-        
-        if not rows:
-            return {'found': False, 'status': 'not_submitted', 'text': 'Заявление не подано'}
-        
-        data_rows = rows[config['header_rows']:] if len(rows) > config['header_rows'] else []
-        
-        for idx, row in enumerate(data_rows):
-            if len(row) >= 2:
-                row_student_num = self._normalize_student_number(row[1] if len(row) > 1 else '')
-                if row_student_num == self._normalize_student_number(student_number):
-                    return self._parse_travel_compensation_row(row)
-        
-        for idx, row in enumerate(data_rows):
-            if len(row) >= 1:
-                fio = row[0].strip()
-                if last_name.lower() in fio.lower():
-                    return self._parse_travel_compensation_row(row)
-        
-        return {'found': False, 'status': 'not_submitted', 'text': 'Заявление не подано'}
+        """Проверка статуса компенсации проезда: по номеру билета, затем по фамилии"""
+        row = snapshot.by_student_number.get(_normalize_student_number(student_number))
+        if row is None:
+            row = snapshot.by_surname.get(_normalize_surname(last_name))
+        if row is not None:
+            return self._parse_travel_compensation_row(row)
+
+        return dict(NOT_SUBMITTED)
 
-    async def _check_housing_compensation(
+    def _check_housing_compensation(
         self, 
-        token: str, 
+        snapshot: SheetSnapshot, 
         last_name: str, 
         first_name: str
     ) -> Dict:
-        """Проверка статуса компенсации общежития"""
-        config = SHEETS_CONFIG['housing_compensation']
-        rows, _ = await self._get_sheet_data(token, config['id'], config['sheet_name'], config['range'])
-        
-        if not rows:
-            return {'found': False, 'status': 'not_submitted', 'text': 'Заявление не подано'}
-        
-        data_rows = rows[config['header_rows']:] if len(rows) > config['header_rows'] else []
-        
-        full_name_pattern = f"{last_name} {first_name[0]}."
-        
-        for idx, row in enumerate(data_rows):
-            if len(row) >= 2:
-                fio = row[1].strip()
-                if full_name_pattern.lower() in fio.lower() or fio.lower() in full_name_pattern.lower():
-                    return self._parse_housing_compensation_row(row)
-        
-        return {'found': False, 'status': 'not_submitted', 'text': 'Заявление не подано'}
+        """Проверка статуса компенсации общежития по фамилии и инициалу"""
+        row = snapshot.by_surname_initial.get(_surname_initial_key(last_name, first_name))
+        if row is not None:
+            return self._parse_housing_compensation_row(row)
+
+        return dict(NOT_SUBMITTED)
 
     def _parse_material_help_row(self, row: List) -> Dict:
         """Парсинг строки материальной помощи
@@ -357,11 +570,6 @@ class ApplicationStatusChecker:
         
         return {'found': True, 'status': 'pending', 'text': f'ℹ️ {status_text}'}
 
-    @staticmethod
-    def _normalize_student_number(num: str) -> str:
-        """Нормализация номера студенческого для сравнения"""
-        return re.sub(r'\s+', '', num.upper().strip())
-
 
 # Singleton экземпляр
 _checker = None
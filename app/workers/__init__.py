@@ -0,0 +1,2 @@
+# Точки входа для пулов процессов. Процесс пула (spawn) импортирует только
+# модуль своей функции, поэтому модули здесь не тянут за собой бота.
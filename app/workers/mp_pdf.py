@@ -0,0 +1,18 @@
+import time
+from typing import Tuple
+
+from app.student.pdf_generator import MP_TEMPLATE_PATH, MPProfile, fill_mp_pdf, get_mp_template
+
+
+def warm_up() -> None:
+    """Разобрать шаблон в процессе пула (initializer)"""
+    get_mp_template()
+
+
+def generate(
+    profile: MPProfile, selected: Tuple[str, ...], submitted_at: float
+) -> Tuple[bytes, float, float]:
+    """Собрать заявление в процессе пула. Возвращает PDF, ожидание в очереди и время генерации"""
+    started_at = time.time()
+    pdf_bytes = fill_mp_pdf(MP_TEMPLATE_PATH, None, profile, selected)
+    return pdf_bytes, started_at - submitted_at, time.time() - started_at
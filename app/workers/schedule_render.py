@@ -0,0 +1,41 @@
+import io
+
+import pypdfium2 as pdfium
+
+
+def count_pages(pdf_bytes: bytes) -> int:
+    document = pdfium.PdfDocument(pdf_bytes)
+    try:
+        return len(document)
+    finally:
+        document.close()
+
+
+def render_page(
+    pdf_bytes: bytes,
+    page_index: int,
+    scale: float,
+    image_format: str,
+    quality: int,
+    optimize: bool,
+) -> bytes:
+    """Рендерим одну страницу PDF с помощью pdfium (выполняется в процессе пула)."""
+    document = pdfium.PdfDocument(pdf_bytes)
+    try:
+        page = document.get_page(page_index)
+        bitmap = page.render(scale=scale)
+        pil_image = bitmap.to_pil()
+        page.close()
+    finally:
+        document.close()
+
+    save_kwargs = {"optimize": optimize}
+    if image_format == "JPEG":
+        pil_image = pil_image.convert("RGB")
+        save_kwargs["quality"] = quality
+    elif image_format == "WEBP":
+        save_kwargs = {"quality": quality, "method": 6 if optimize else 4}
+
+    buffer = io.BytesIO()
+    pil_image.save(buffer, format=image_format, **save_kwargs)
+    return buffer.getvalue()
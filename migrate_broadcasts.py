@@ -0,0 +1,45 @@
+import asyncio
+from app.database import db
+from dotenv import load_dotenv
+
+load_dotenv()
+
+async def migrate():
+    print("Connecting to database...")
+    await db.connect()
+
+    print("Creating 'broadcast_jobs' and 'broadcast_deliveries' tables if they do not exist...")
+    try:
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                id SERIAL PRIMARY KEY,
+                name TEXT,
+                from_chat_id BIGINT NOT NULL,
+                message_id BIGINT NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'active',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+                job_id INTEGER REFERENCES broadcast_jobs(id) ON DELETE CASCADE,
+                chat_id BIGINT NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                error TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (job_id, chat_id)
+            )
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_broadcast_deliveries_queued
+                ON broadcast_deliveries (job_id) WHERE status = 'queued'
+        """)
+        print("Tables 'broadcast_jobs' and 'broadcast_deliveries' are ready.")
+    except Exception as e:
+        print(f"Error creating tables: {e}")
+
+    await db.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
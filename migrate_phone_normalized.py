@@ -0,0 +1,28 @@
+import asyncio
+from app.database import db
+from dotenv import load_dotenv
+
+load_dotenv()
+
+async def migrate():
+    print("Connecting to database...")
+    await db.connect()
+
+    print("Adding 'phone_normalized' column and lookup indexes to 'users' table...")
+    try:
+        await db.execute("""
+            ALTER TABLE users ADD COLUMN IF NOT EXISTS phone_normalized VARCHAR(10)
+                GENERATED ALWAYS AS (RIGHT(regexp_replace(phone, '\\D', '', 'g'), 10)) STORED
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users (username)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_users_bauman_login ON users (bauman_login)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_users_student_number ON users (student_number)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_users_phone_normalized ON users (phone_normalized)")
+        print("Column 'phone_normalized' and indexes are ready.")
+    except Exception as e:
+        print(f"Error altering table: {e}")
+
+    await db.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,36 @@
+import asyncio
+from app.database import db
+from dotenv import load_dotenv
+
+load_dotenv()
+
+async def migrate():
+    print("Connecting to database...")
+    await db.connect()
+
+    print("Adding segment columns and indexes to 'users', 'fee_payments' and 'applications'...")
+    try:
+        await db.execute("""
+            ALTER TABLE users
+                ADD COLUMN IF NOT EXISTS group_faculty VARCHAR(50)
+                    GENERATED ALWAYS AS (substring(group_name from '^[А-ЯA-Z]+')) STORED,
+                ADD COLUMN IF NOT EXISTS group_department VARCHAR(50)
+                    GENERATED ALWAYS AS (substring(group_name from '^[^-]+')) STORED,
+                ADD COLUMN IF NOT EXISTS course SMALLINT
+                    GENERATED ALWAYS AS (((substring(group_name from '-(\\d)')::int + 1) / 2)::smallint) STORED
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_users_faculty_course ON users (group_faculty, course)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_users_group_department ON users (group_department)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_users_group_name ON users (group_name)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_fee_payments_user_status ON fee_payments (user_id, status)")
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_applications_event_user ON applications (related_event_id, user_id)"
+        )
+        print("Segment columns and indexes are ready.")
+    except Exception as e:
+        print(f"Error altering table: {e}")
+
+    await db.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
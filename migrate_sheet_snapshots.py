@@ -0,0 +1,28 @@
+import asyncio
+from app.database import db
+from dotenv import load_dotenv
+
+load_dotenv()
+
+async def migrate():
+    print("Connecting to database...")
+    await db.connect()
+
+    print("Creating 'sheet_snapshots' table if it does not exist...")
+    try:
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS sheet_snapshots (
+                sheet_key VARCHAR(50) PRIMARY KEY,
+                rows JSONB NOT NULL,
+                fetched_at TIMESTAMPTZ NOT NULL
+            )
+        """)
+        await db.execute("ALTER TABLE sheet_snapshots ADD COLUMN IF NOT EXISTS version VARCHAR(50)")
+        print("Table 'sheet_snapshots' is ready.")
+    except Exception as e:
+        print(f"Error creating table: {e}")
+
+    await db.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
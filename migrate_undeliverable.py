@@ -0,0 +1,22 @@
+import asyncio
+from app.database import db
+from dotenv import load_dotenv
+
+load_dotenv()
+
+async def migrate():
+    print("Connecting to database...")
+    await db.connect()
+
+    print("Adding undeliverable columns to 'users' table...")
+    try:
+        await db.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS undeliverable_at TIMESTAMP")
+        await db.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS undeliverable_reason VARCHAR(50)")
+        print("Columns 'undeliverable_at' and 'undeliverable_reason' are ready.")
+    except Exception as e:
+        print(f"Error altering table: {e}")
+
+    await db.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
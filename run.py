@@ -1,5 +1,8 @@
 import asyncio
-from app.main import start_bot
 
 if __name__ == "__main__":
+    # Импорт под main: процессы пулов (spawn) заново импортируют этот модуль,
+    # и без этого каждый загружал бы весь бот
+    from app.main import start_bot
+
     asyncio.run(start_bot())
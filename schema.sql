@@ -19,9 +19,28 @@ CREATE TABLE IF NOT EXISTS users (
     phone VARCHAR(50),
     role_id INTEGER REFERENCES roles(id),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    update_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    update_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    undeliverable_at TIMESTAMP,             -- Когда рассылка не дошла: бот заблокирован, аккаунт удалён
+    undeliverable_reason VARCHAR(50),       -- blocked, deactivated, forbidden, chat_not_found
+    -- Последние 10 цифр телефона: +7 и 8 в начале не различаются, поиск идёт по индексу
+    phone_normalized VARCHAR(10) GENERATED ALWAYS AS (RIGHT(regexp_replace(phone, '\D', '', 'g'), 10)) STORED,
+    -- Части названия группы для сегментов рассылки: ИУ6-54Б -> ИУ, ИУ6, 3 курс
+    group_faculty VARCHAR(50) GENERATED ALWAYS AS (substring(group_name from '^[А-ЯA-Z]+')) STORED,
+    group_department VARCHAR(50) GENERATED ALWAYS AS (substring(group_name from '^[^-]+')) STORED,
+    course SMALLINT GENERATED ALWAYS AS (((substring(group_name from '-(\d)')::int + 1) / 2)::smallint) STORED
 );
 
+-- Индексы для поиска получателей рассылки по идентификаторам
+CREATE INDEX IF NOT EXISTS idx_users_username ON users (username);
+CREATE INDEX IF NOT EXISTS idx_users_bauman_login ON users (bauman_login);
+CREATE INDEX IF NOT EXISTS idx_users_student_number ON users (student_number);
+CREATE INDEX IF NOT EXISTS idx_users_phone_normalized ON users (phone_normalized);
+
+-- Индексы для сегментов рассылки
+CREATE INDEX IF NOT EXISTS idx_users_faculty_course ON users (group_faculty, course);
+CREATE INDEX IF NOT EXISTS idx_users_group_department ON users (group_department);
+CREATE INDEX IF NOT EXISTS idx_users_group_name ON users (group_name);
+
 -- Таблица новостей
 CREATE TABLE IF NOT EXISTS news (
     id SERIAL PRIMARY KEY,
@@ -97,6 +116,42 @@ CREATE TABLE IF NOT EXISTS fee_payments (
     comment TEXT
 );
 
+-- Сегменты рассылки: статус взноса и запись на мероприятие по пользователю
+CREATE INDEX IF NOT EXISTS idx_fee_payments_user_status ON fee_payments (user_id, status);
+CREATE INDEX IF NOT EXISTS idx_applications_event_user ON applications (related_event_id, user_id);
+
+-- Последние загруженные снимки листов Google Sheets со статусами заявлений
+CREATE TABLE IF NOT EXISTS sheet_snapshots (
+    sheet_key VARCHAR(50) PRIMARY KEY,
+    rows JSONB NOT NULL,
+    fetched_at TIMESTAMPTZ NOT NULL,
+    version VARCHAR(50)             -- Версия файла в Google Drive на момент загрузки
+);
+
+-- Рассылки: копия сообщения (from_chat_id, message_id) списку получателей
+CREATE TABLE IF NOT EXISTS broadcast_jobs (
+    id SERIAL PRIMARY KEY,
+    name TEXT,
+    from_chat_id BIGINT NOT NULL,
+    message_id BIGINT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'active',   -- preparing, active, done, cancelled
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- Доставка рассылки каждому получателю
+CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+    job_id INTEGER REFERENCES broadcast_jobs(id) ON DELETE CASCADE,
+    chat_id BIGINT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',   -- queued, sending, sent, failed, blocked, cancelled
+    error TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (job_id, chat_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_broadcast_deliveries_queued
+    ON broadcast_deliveries (job_id) WHERE status = 'queued';
+
 -- Инициализация базовых данных (Справочники)
 
 -- Роли
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from app.http_client import HttpClient
+
+
+async def _serve(handler) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner
+
+
+def _url(runner: web.AppRunner) -> str:
+    host, port = runner.addresses[0][:2]
+    return f"http://{host}:{port}/"
+
+
+async def _slow(request: web.Request) -> web.Response:
+    await asyncio.sleep(2)
+    return web.json_response({"ok": True})
+
+
+async def _fast(request: web.Request) -> web.Response:
+    return web.json_response({"ok": True})
+
+
+def test_default_timeout_applies_without_explicit_timeout():
+    async def run():
+        runner = await _serve(_slow)
+        client = HttpClient(timeout=0.2, retries=0)
+        try:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            with pytest.raises(asyncio.TimeoutError):
+                await client.get_json(_url(runner))
+            assert loop.time() - started < 1
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_explicit_timeout_overrides_default():
+    async def run():
+        runner = await _serve(_slow)
+        client = HttpClient(timeout=30, retries=0)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await client.get_json(_url(runner), timeout=0.2)
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_fast_response_is_returned():
+    async def run():
+        runner = await _serve(_fast)
+        client = HttpClient(timeout=1, retries=0)
+        try:
+            assert await client.get_json(_url(runner)) == {"ok": True}
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(run())